@@ -0,0 +1,65 @@
+"""Stand-ins for the discord.py objects the tracker and leaderboards use"""
+import asyncio
+import types
+from typing import Dict, Optional, Tuple
+
+def guild_id(index: int) -> int:
+    """A snowflake-shaped guild id"""
+    return (1420070400000 + index * 7919) << 22
+
+class FakeUser:
+    def __init__(self, user_id: int, name: Optional[str] = None):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+    
+    def __str__(self):
+        return self.name
+
+class FakeMember(FakeUser):
+    def __init__(self, guild: "FakeGuild", user_id: int):
+        super().__init__(user_id)
+        self.guild = guild
+
+class FakeInvite:
+    def __init__(self, guild: "FakeGuild", code: str, inviter_id: int, uses: int, max_uses: int = 0):
+        self.guild = guild
+        self.code = code
+        self.inviter = FakeUser(inviter_id)
+        self.uses = uses
+        self.max_uses = max_uses
+        self.expires_at = None
+
+class FakeGuild:
+    """A guild whose invite list is `invites_state` (code -> (inviter_id, uses[, max_uses])), fetched with a delay"""
+    
+    def __init__(self, index: int, fetch_delay: float = 0.01):
+        self.id = guild_id(index)
+        self.name = f"guild{index}"
+        self.icon = None
+        self.me = types.SimpleNamespace(guild_permissions=types.SimpleNamespace(manage_guild=True))
+        self.invites_state: Dict[str, Tuple[int, ...]] = {}
+        self.members: Dict[int, FakeMember] = {}
+        self.fetch_delay = fetch_delay
+    
+    async def invites(self):
+        await asyncio.sleep(self.fetch_delay)
+        return [FakeInvite(self, code, *state) for code, state in self.invites_state.items()]
+    
+    def get_member(self, user_id: int):
+        return self.members.get(user_id)
+
+class FakeBot:
+    """Resolves any user id after `fetch_delay` seconds, counting the requests"""
+    
+    def __init__(self, fetch_delay: float = 0.05):
+        self.fetch_delay = fetch_delay
+        self.fetches = 0
+    
+    def get_user(self, user_id: int):
+        return None
+    
+    async def fetch_user(self, user_id: int):
+        self.fetches += 1
+        await asyncio.sleep(self.fetch_delay)
+        return FakeUser(user_id)
@@ -0,0 +1,73 @@
+"""Invite event throughput across many guilds
+
+    python -m benchmarks.guild_throughput [--guilds 1 10 50 200] [--rounds 5]
+
+Every guild gets `rounds` rounds of interleaved events: one invite is used
+and its member joins, then a new invite is created. Guilds run concurrently
+through one InviteTracker; each guild's events are serialized by its lock.
+Reports events per second and checks that every use was attributed once.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import FakeGuild, FakeInvite, FakeMember
+from database import InviteDatabase
+from invite_tracker import InviteTracker
+
+INVITES_PER_GUILD = 20
+
+async def run(guild_count: int, rounds: int):
+    db = InviteDatabase(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    tracker = InviteTracker(None, db, join_debounce=0.0)
+    
+    guilds = [FakeGuild(index) for index in range(guild_count)]
+    for guild in guilds:
+        guild.invites_state = {f"{guild.id}-{k}": (1000 + k, 0) for k in range(INVITES_PER_GUILD)}
+        await tracker.cache_invites(guild)
+    
+    async def guild_events(guild: FakeGuild):
+        for r in range(rounds):
+            code = f"{guild.id}-{r % INVITES_PER_GUILD}"
+            inviter_id, uses = guild.invites_state[code]
+            guild.invites_state[code] = (inviter_id, uses + 1)
+            await tracker.on_member_join(FakeMember(guild, 10_000 + r))
+            
+            new_code = f"{guild.id}-new{r}"
+            guild.invites_state[new_code] = (2000 + r, 0)
+            await tracker.on_invite_create(FakeInvite(guild, new_code, 2000 + r, 0))
+            await asyncio.sleep(0)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(guild_events(guild) for guild in guilds))
+    while tracker._join_tasks:
+        await asyncio.sleep(0.001)
+    for guild in guilds:
+        async with tracker._guild_lock(guild.id):
+            pass
+    await db.flush()
+    elapsed = time.perf_counter() - start
+    
+    attributed = [
+        sum(total_uses for _, _, total_uses in await db.get_leaderboard(guild.id, limit=INVITES_PER_GUILD))
+        for guild in guilds
+    ]
+    await db.close()
+    return elapsed, all(count == rounds for count in attributed)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    
+    print(f"{'guilds':>6} {'events':>7} {'seconds':>8} {'events/s':>9}  attributed once")
+    for guild_count in args.guilds:
+        elapsed, exact = await run(guild_count, args.rounds)
+        events = guild_count * args.rounds * 2
+        print(f"{guild_count:6} {events:7} {elapsed:8.2f} {events / elapsed:9.0f}  {'yes' if exact else 'NO'}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
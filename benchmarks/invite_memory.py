@@ -0,0 +1,66 @@
+"""Memory held by the invite cache, discord.Invite vs. CachedInvite
+
+    python -m benchmarks.invite_memory [--invites 100000]
+
+Builds the invites the way Guild.invites() does (sharing one guild and
+channel, with a new User per inviter payload) and measures with tracemalloc
+what a cache of them keeps alive: the discord.Invite objects the tracker
+used to store, and the CachedInvite copies it stores now.
+"""
+import argparse
+import tracemalloc
+import types
+
+import discord
+
+from invite_tracker import CachedInvite
+
+def invite_payload(i: int) -> dict:
+    return {
+        "code": f"code{i:07d}",
+        "inviter": {
+            "id": str(10**17 + i % 500),
+            "username": f"user{i % 500}",
+            "discriminator": "0",
+            "avatar": None,
+            "global_name": f"User {i % 500}",
+        },
+        "uses": i % 100,
+        "max_uses": 0,
+        "max_age": 0,
+        "temporary": False,
+        "created_at": "2025-01-01T00:00:00+00:00",
+        "expires_at": None,
+    }
+
+def cached_bytes(count: int, convert) -> float:
+    """Bytes per invite kept alive by a code -> convert(discord.Invite) dict"""
+    state = types.SimpleNamespace(http=None)
+    state.create_user = lambda data: discord.User(state=state, data=data)
+    guild = discord.Object(id=1)
+    channel = discord.Object(id=2)
+    
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    cache = {}
+    for i in range(count):
+        invite = convert(discord.Invite(state=state, data=invite_payload(i), guild=guild, channel=channel))
+        cache[invite.code] = invite
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename")) / count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invites", type=int, default=100000, help="invites in the cache")
+    args = parser.parse_args()
+    
+    full = cached_bytes(args.invites, lambda invite: invite)
+    slim = cached_bytes(args.invites, CachedInvite.from_invite)
+    print(f"{args.invites} cached invites")
+    print(f"discord.Invite  {full:8.0f} bytes/invite  {full * args.invites / 2**20:7.1f} MiB")
+    print(f"CachedInvite    {slim:8.0f} bytes/invite  {slim * args.invites / 2**20:7.1f} MiB")
+    print(f"saved           {1 - slim / full:8.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""100 simultaneous leaderboard requests for one guild
+
+    python -m benchmarks.leaderboard_burst [--requests 100] [--inviters 2000]
+
+Fires the requests at once against a cold embed cache, with and without
+coalescing, on SQLite and the in-memory backend. User lookups take 50 ms.
+"cold" starts with an empty user directory; "warm" runs again once the
+first pass has stored every name, so no lookups are needed.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import FakeBot, FakeGuild
+from database import InviteDatabase
+from leaderboard import LeaderboardManager
+from memory_storage import MemoryStorage
+
+class _NoCoalescing(dict):
+    """Build registry that never finds a build in flight"""
+    
+    def get(self, key, default=None):
+        return default
+
+async def burst(db, guild: FakeGuild, bot: FakeBot, requests: int, coalesce: bool):
+    manager = LeaderboardManager(bot, db)
+    if not coalesce:
+        manager._builds = _NoCoalescing()
+    
+    reads = 0
+    read = db.get_leaderboard_with_names
+    
+    async def counted_read(*args, **kwargs):
+        nonlocal reads
+        reads += 1
+        return await read(*args, **kwargs)
+    
+    db.get_leaderboard_with_names = counted_read
+    bot.fetches = 0
+    start = time.perf_counter()
+    embeds = await asyncio.gather(*(manager.create_leaderboard_embed(guild) for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    del db.get_leaderboard_with_names
+    
+    assert len({embed.fields[0].value for embed in embeds}) == 1
+    return elapsed, reads, bot.fetches
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--inviters", type=int, default=2000)
+    args = parser.parse_args()
+    
+    print(f"{'backend':8} {'coalesce':9} {'directory':10} {'time':>9} {'reads':>6} {'fetches':>8}")
+    for coalesce in (False, True):
+        for name in ("sqlite", "memory"):
+            db = InviteDatabase(os.path.join(tempfile.mkdtemp(), "bench.db")) if name == "sqlite" else MemoryStorage()
+            guild = FakeGuild(0)
+            bot = FakeBot()
+            for user in range(args.inviters):
+                await db.record_invite_use(guild.id, user + 2, user % 97 + 1)
+            await db.flush()
+            
+            for directory in ("cold", "warm"):
+                elapsed, reads, fetches = await burst(db, guild, bot, args.requests, coalesce)
+                print(f"{name:8} {'yes' if coalesce else 'no':9} {directory:10} {elapsed * 1e3:7.1f}ms {reads:6} {fetches:8}")
+            await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
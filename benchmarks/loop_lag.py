@@ -0,0 +1,65 @@
+"""Event-loop lag while invite uses are written
+
+    python -m benchmarks.loop_lag [--writes 300]
+
+A probe sleeps 1 ms in a loop while concurrent writes each commit one
+invite use, and reports how late it wakes up. "inline" runs the same SQL
+directly in the coroutine, the way InviteDatabase did before its work moved
+to the database threads; "threaded" runs it on the writer thread.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from database import InviteDatabase
+
+GUILD_ID = 1420070400000 << 22
+
+async def measure(db: InviteDatabase, write, writes: int):
+    lags = []
+    done = False
+    
+    async def probe():
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+    
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(write(i) for i in range(writes)))
+    elapsed = time.perf_counter() - start
+    done = True
+    await probe_task
+    
+    lags.sort()
+    return elapsed, len(lags), lags[int(len(lags) * 0.99)], lags[-1]
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=300, help="concurrent invite uses written")
+    args = parser.parse_args()
+    
+    db = InviteDatabase(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    
+    # One commit per use in both modes; the write-behind buffer would batch them
+    def use(i: int):
+        return [(GUILD_ID, None, i % 50, None, int(time.time()))]
+    
+    async def inline(i: int):
+        db._flush_joins(use(i))
+    
+    async def threaded(i: int):
+        await db._run_write(db._flush_joins, use(i))
+    
+    print(f"{'mode':10} {'total':>9} {'probes':>7} {'p99 lag':>9} {'max lag':>9}")
+    for name, write in (("inline", inline), ("threaded", threaded)):
+        elapsed, probes, p99, worst = await measure(db, write, args.writes)
+        print(f"{name:10} {elapsed * 1e3:7.0f}ms {probes:7} {p99 * 1e3:7.1f}ms {worst * 1e3:7.1f}ms")
+    
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""File size and query latency before and after the v2 schema migration
+
+    python -m benchmarks.schema_migration [--guilds 50] [--inviters 200] [--days 90] [--calls 500]
+
+Builds a database at schema version 6 (text dates and timestamps in rowid
+tables), fills it, then opens it with InviteDatabase, which migrates it to
+the v2 layout. Both files are vacuumed before they are measured, and the
+same reads are timed on each with a warm page cache.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import MIGRATIONS, InviteDatabase, _migrate_compact_schema
+
+V1_VERSION = MIGRATIONS.index(_migrate_compact_schema)
+
+def build_v1(path: str, guilds: int, inviters: int, days: int):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("BEGIN")
+    for migration in MIGRATIONS[:V1_VERSION]:
+        migration(conn.cursor())
+    conn.execute(f"PRAGMA user_version = {V1_VERSION}")
+    
+    rng = random.Random(0)
+    today = date.today()
+    for guild in range(1, guilds + 1):
+        conn.executemany(
+            "INSERT INTO invite_stats (user_id, guild_id, total_invites, total_uses) VALUES (?, ?, ?, ?)",
+            [(user, guild, rng.randint(0, 5), rng.randint(0, 500)) for user in range(1, inviters + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO invites (invite_code, guild_id, inviter_id, uses, expires_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (f"g{guild}c{i}", guild, rng.randint(1, inviters), rng.randint(0, 50),
+                 (today + timedelta(days=7)).isoformat() + " 00:00:00")
+                for i in range(inviters // 2)
+            ]
+        )
+        conn.executemany(
+            "INSERT INTO daily_stats (user_id, guild_id, date, invites_used) VALUES (?, ?, ?, ?)",
+            [
+                (user, guild, (today - timedelta(days=day)).isoformat(), rng.randint(1, 5))
+                for day in range(days)
+                for user in rng.sample(range(1, inviters + 1), inviters // 3)
+            ]
+        )
+    conn.execute("COMMIT")
+    conn.execute("VACUUM")
+    conn.close()
+
+def reads(v2: bool):
+    """(name, SQL, args(guild, user)) of the timed reads in each layout"""
+    since = date.today() - timedelta(days=7)
+    if v2:
+        period, since_value = "day", (since - date(1970, 1, 1)).days
+    else:
+        period, since_value = "date", since.isoformat()
+    return [
+        ("leaderboard top 10", """
+            SELECT user_id, total_invites, total_uses FROM invite_stats WHERE guild_id = ?
+            ORDER BY total_uses DESC, total_invites DESC, user_id LIMIT 10
+        """, lambda guild, user: (guild,)),
+        ("7-day leaderboard", f"""
+            SELECT user_id, SUM(invites_used) AS uses FROM daily_stats
+            WHERE guild_id = ? AND {period} >= ? GROUP BY user_id ORDER BY uses DESC LIMIT 10
+        """, lambda guild, user: (guild, since_value)),
+        ("user stats", """
+            SELECT total_invites, total_uses FROM invite_stats WHERE guild_id = ? AND user_id = ?
+        """, lambda guild, user: (guild, user)),
+        ("active invites", """
+            SELECT invite_code, inviter_id, uses, max_uses, expires_at FROM invites
+            WHERE guild_id = ? AND is_active = 1
+        """, lambda guild, user: (guild,)),
+    ]
+
+def measure(path: str, v2: bool, guilds: int, inviters: int, calls: int):
+    conn = sqlite3.connect(path)
+    results = {"file size": os.path.getsize(path)}
+    for name, sql, args in reads(v2):
+        start = time.perf_counter()
+        for i in range(calls):
+            conn.execute(sql, args(i % guilds + 1, i % inviters + 1)).fetchall()
+        results[name] = (time.perf_counter() - start) / calls
+    conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--inviters", type=int, default=200, help="inviters per guild")
+    parser.add_argument("--days", type=int, default=90, help="days of daily stats")
+    parser.add_argument("--calls", type=int, default=500, help="calls timed per read")
+    args = parser.parse_args()
+    
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    build_v1(path, args.guilds, args.inviters, args.days)
+    before = measure(path, False, args.guilds, args.inviters, args.calls)
+    
+    start = time.perf_counter()
+    db = InviteDatabase(path)
+    migrated = time.perf_counter() - start
+    asyncio.run(db.close())
+    
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+    after = measure(path, True, args.guilds, args.inviters, args.calls)
+    
+    print(f"migrated to version {len(MIGRATIONS)} in {migrated:.2f}s")
+    print(f"{'':22}{'v1':>12}{'v2':>12}")
+    for name in before:
+        if name == "file size":
+            print(f"{name:22}{before[name] / 2**20:10.1f}MB{after[name] / 2**20:10.1f}MB")
+        else:
+            print(f"{name:22}{before[name] * 1e6:10.1f}us{after[name] * 1e6:10.1f}us")
+
+if __name__ == "__main__":
+    main()
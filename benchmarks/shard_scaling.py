@@ -0,0 +1,56 @@
+"""Write throughput by shard count
+
+    python -m benchmarks.shard_scaling [--shards 1 2 4 8] [--guilds 32] [--rounds 30]
+
+Each guild runs `rounds` join handlers back to back; every handler is one
+unit of work holding a join, a reconcile of 50 invites and an invite count
+update, like InviteTracker's join path. Guilds run concurrently, spread
+over the shards. Reports handlers per second with synchronous=NORMAL (the
+default) and FULL.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import guild_id
+from database import InviteDatabase, ShardedInviteDatabase
+
+async def run(shards: int, guilds: int, rounds: int, synchronous: str) -> float:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = ShardedInviteDatabase(path, shards=shards) if shards > 1 else InviteDatabase(path)
+    for shard in db.shards:
+        await shard._run_write(lambda shard=shard: shard._connection().execute(f"PRAGMA synchronous = {synchronous}"))
+    
+    invites = [(f"c{i}", 10 + i % 20, i, 0, None) for i in range(50)]
+    
+    async def join_handlers(guild: int):
+        for r in range(rounds):
+            async with db.transaction():
+                await db.record_joins(guild, [(r, 10, "c0")])
+                await db.reconcile_invites(guild, [(code, inviter, uses + r, max_uses, expires)
+                                                   for code, inviter, uses, max_uses, expires in invites])
+                await db.update_invite_counts_bulk(guild, [(10, 3)])
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(join_handlers(guild_id(index)) for index in range(guilds)))
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return guilds * rounds / elapsed
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--guilds", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=30)
+    args = parser.parse_args()
+    
+    print(f"{os.cpu_count()} CPUs; join handlers per second")
+    print("shards         " + "".join(f"{shards:>7}" for shards in args.shards))
+    for synchronous in ("NORMAL", "FULL"):
+        rates = [await run(shards, args.guilds, args.rounds, synchronous) for shards in args.shards]
+        print(f"sync={synchronous:9}" + "".join(f"{rate:7.0f}" for rate in rates))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""Per-operation latency of the storage backends
+
+    python -m benchmarks.storage_latency [--calls 300]
+
+Fills each backend with 20 guilds of 200 inviters and 50 invites, then
+times the calls the tracker and leaderboards make. The SQLite database
+flushes every join (flush_size=1), so record_joins includes its commit.
+The in-memory backend is the baseline.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from database import InviteDatabase
+from memory_storage import MemoryStorage
+
+GUILDS = 20
+INVITERS = 200
+
+async def fill(db, invites):
+    for guild in range(GUILDS):
+        await db.add_invites_bulk(guild, invites)
+        for user in range(INVITERS):
+            await db.record_joins(guild, [(None, 1000 + user, None)] * (user % 7 + 1))
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300, help="calls timed per operation")
+    args = parser.parse_args()
+    
+    invites = [(f"c{i}", 1000 + i % 50, i, 0, None) for i in range(50)]
+    backends = {
+        "sqlite": InviteDatabase(os.path.join(tempfile.mkdtemp(), "bench.db"), flush_size=1),
+        "memory": MemoryStorage(),
+    }
+    
+    results = {}
+    for name, db in backends.items():
+        await fill(db, invites)
+        operations = [
+            ("record_joins", lambda i: db.record_joins(i % GUILDS, [(i, 1000 + i % INVITERS, "c1")])),
+            ("reconcile 50 invites", lambda i: db.reconcile_invites(i % GUILDS, invites)),
+            ("update_invite_count", lambda i: db.update_invite_count(i % GUILDS, 1000, i)),
+            ("get_leaderboard", lambda i: db.get_leaderboard(i % GUILDS)),
+            ("daily leaderboard 7d", lambda i: db.get_daily_leaderboard(i % GUILDS, 7)),
+            ("daily leaderboard 14d", lambda i: db.get_daily_leaderboard(i % GUILDS, 14)),
+            ("get_user_stats", lambda i: db.get_user_stats(i % GUILDS, 1000 + i % INVITERS)),
+        ]
+        for operation, call in operations:
+            start = time.perf_counter()
+            for i in range(args.calls):
+                await call(i)
+            results.setdefault(operation, {})[name] = (time.perf_counter() - start) / args.calls
+        await db.close()
+    
+    print(f"{'operation':24}" + "".join(f"{name:>10}" for name in backends))
+    for operation, timings in results.items():
+        print(f"{operation:24}" + "".join(f"{timings[name] * 1e6:8.1f}us" for name in backends))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,12 +3,25 @@ from discord.ext import commands, tasks
 import asyncio
 import logging
 from datetime import datetime, time
+from typing import Optional
 import os
 
-from config import BOT_TOKEN, LEADERBOARD_CHANNEL_ID, LEADERBOARD_TIME, DATABASE_PATH
-from database import InviteDatabase
+from config import (
+    BOT_TOKEN, LEADERBOARD_CHANNEL_ID, LEADERBOARD_TIME, STORAGE_BACKEND,
+    MEMORY_SNAPSHOT_PATH, MEMORY_SNAPSHOT_INTERVAL, DATABASE_PATH, DATABASE_SHARDS,
+    DATABASE_READERS, DATABASE_BUSY_TIMEOUT, JOIN_DEBOUNCE_SECONDS,
+    WARMUP_CONCURRENCY, DAILY_STATS_RETENTION_DAYS, WEEKLY_STATS_RETENTION_DAYS,
+    COMPACTION_BATCH_SIZE, NAME_CACHE_SIZE, NAME_CACHE_TTL, NAME_NEGATIVE_TTL,
+    NAME_FETCH_CONCURRENCY, LEADERBOARD_CACHE_TTL, LEADERBOARD_INDEX_GUILDS,
+    LEADERBOARD_INDEX_CHECK_INTERVAL
+)
+from database import InviteDatabase, ShardedInviteDatabase
+from memory_storage import MemoryStorage
+from storage import InviteStorage
 from invite_tracker import InviteTracker
 from leaderboard import LeaderboardManager
+from name_resolver import UserNameResolver
+from rebuild import rebuild_aggregates
 
 # Configure logging
 logging.basicConfig(
@@ -35,18 +48,53 @@ class InviteBot(commands.Bot):
         )
         
         # Initialize database and managers
-        self.db = InviteDatabase(DATABASE_PATH)
-        self.invite_tracker = InviteTracker(self, self.db)
-        self.leaderboard_manager = LeaderboardManager(self, self.db)
+        self.db = self._create_storage()
+        self.invite_tracker = InviteTracker(self, self.db, join_debounce=JOIN_DEBOUNCE_SECONDS)
+        # One name cache shared by every embed that lists users
+        self.name_resolver = UserNameResolver(
+            self,
+            cache_size=NAME_CACHE_SIZE,
+            ttl=NAME_CACHE_TTL,
+            negative_ttl=NAME_NEGATIVE_TTL,
+            concurrency=NAME_FETCH_CONCURRENCY
+        )
+        self.leaderboard_manager = LeaderboardManager(
+            self, self.db, self.name_resolver, cache_ttl=LEADERBOARD_CACHE_TTL
+        )
         
         # Track initialization status
         self._is_ready = False
+        self._warmup_task = None
+    
+    def _create_storage(self) -> InviteStorage:
+        """Create the configured storage backend"""
+        if STORAGE_BACKEND == "memory":
+            return MemoryStorage(MEMORY_SNAPSHOT_PATH or None, snapshot_interval=MEMORY_SNAPSHOT_INTERVAL)
+        if STORAGE_BACKEND != "sqlite":
+            logger.warning(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, using sqlite")
+        
+        database_options = dict(
+            readers=DATABASE_READERS,
+            busy_timeout=DATABASE_BUSY_TIMEOUT,
+            index_guilds=LEADERBOARD_INDEX_GUILDS,
+            index_check_interval=LEADERBOARD_INDEX_CHECK_INTERVAL
+        )
+        if DATABASE_SHARDS > 1:
+            return ShardedInviteDatabase(DATABASE_PATH, shards=DATABASE_SHARDS, **database_options)
+        return InviteDatabase(DATABASE_PATH, **database_options)
     
     async def setup_hook(self):
         """Called when the bot is starting up"""
         # Start the daily leaderboard task
         self.daily_leaderboard.start()
         logger.info("Daily leaderboard task started")
+        
+        self.compact_stats.start()
+    
+    async def close(self):
+        """Called when the bot is shutting down"""
+        await super().close()
+        await self.db.close()
     
     async def on_ready(self):
         """Called when the bot is ready"""
@@ -57,10 +105,17 @@ class InviteBot(commands.Bot):
             # Log guild details
             for guild in self.guilds:
                 logger.info(f'Connected to guild: {guild.name} (ID: {guild.id})')
-                await self.invite_tracker.cache_invites(guild)
-                await self.invite_tracker.update_invite_counts(guild)
             
             self._is_ready = True
+        else:
+            logger.info(f'Reconnected to Discord with a new session, reconciling {len(self.guilds)} guilds')
+        
+        # Attribute joins from the stored snapshot right away, then reconcile
+        # it against the live invite lists in the background. A new session
+        # also follows missed events (e.g. joins while disconnected), so this
+        # runs on every ready, not just the first.
+        await self.invite_tracker.seed_from_database(self.guilds)
+        self._warmup_task = asyncio.create_task(self._warm_up(self._warmup_task))
         
         # Update activity status
         activity = discord.Activity(
@@ -69,11 +124,16 @@ class InviteBot(commands.Bot):
         )
         await self.change_presence(activity=activity)
     
+    async def _warm_up(self, previous: Optional[asyncio.Task]):
+        """Reconcile every guild's invites once an earlier session's warmup has finished"""
+        if previous is not None and not previous.done():
+            await previous
+        await self.invite_tracker.warm_up(self.guilds, concurrency=WARMUP_CONCURRENCY)
+    
     async def on_guild_join(self, guild):
         """Called when the bot joins a new guild"""
         logger.info(f"Joined new guild: {guild.name} (ID: {guild.id})")
         await self.invite_tracker.cache_invites(guild)
-        await self.invite_tracker.update_invite_counts(guild)
     
     async def on_invite_create(self, invite):
         """Called when an invite is created"""
@@ -87,6 +147,10 @@ class InviteBot(commands.Bot):
         """Called when a member joins a guild"""
         await self.invite_tracker.on_member_join(member)
     
+    async def on_member_remove(self, member):
+        """Called when a member leaves a guild"""
+        await self.invite_tracker.on_member_remove(member)
+    
     @tasks.loop(time=time.fromisoformat(LEADERBOARD_TIME))
     async def daily_leaderboard(self):
         """Post daily leaderboard at scheduled time"""
@@ -102,6 +166,8 @@ class InviteBot(commands.Bot):
                     logger.warning(f"Leaderboard channel {LEADERBOARD_CHANNEL_ID} not found or not a text channel")
             else:
                 logger.info("No leaderboard channel configured, skipping daily post")
+            
+            logger.info(f"Leaderboard cache: {self.leaderboard_manager.cache_stats()}")
                 
         except Exception as e:
             logger.error(f"Error in daily leaderboard task: {e}")
@@ -110,6 +176,23 @@ class InviteBot(commands.Bot):
     async def before_daily_leaderboard(self):
         """Wait until the bot is ready before starting the loop"""
         await self.wait_until_ready()
+    
+    @tasks.loop(hours=24)
+    async def compact_stats(self):
+        """Roll old daily statistics into weekly/monthly rollups"""
+        try:
+            await self.db.compact_stats(
+                daily_retention_days=DAILY_STATS_RETENTION_DAYS,
+                weekly_retention_days=WEEKLY_STATS_RETENTION_DAYS,
+                batch_size=COMPACTION_BATCH_SIZE
+            )
+        except Exception as e:
+            logger.error(f"Error in statistics compaction task: {e}")
+    
+    @compact_stats.before_loop
+    async def before_compact_stats(self):
+        """Wait until the bot is ready before starting the loop"""
+        await self.wait_until_ready()
 
 # Initialize the bot
 bot = InviteBot()
@@ -157,6 +240,12 @@ async def help_command(ctx):
         inline=False
     )
     
+    embed.add_field(
+        name="🛠️ !rebuild",
+        value="Recompute invite statistics from the join log (Admin only)",
+        inline=False
+    )
+    
     embed.set_footer(text="Use these commands to track invite performance!")
     
     await ctx.send(embed=embed)
@@ -215,6 +304,36 @@ async def refresh_error(ctx, error):
         )
         await ctx.send(embed=embed)
 
+@bot.command(name='rebuild')
+@commands.has_permissions(administrator=True)
+async def rebuild_command(ctx):
+    """Recompute this server's invite statistics from the join log (Admin only)"""
+    try:
+        if isinstance(bot.db, MemoryStorage):
+            raise RuntimeError("the memory backend keeps no join log to rebuild from")
+        
+        async with ctx.typing():
+            rebuilt = await rebuild_aggregates(bot.db, [ctx.guild.id])
+        
+        if not rebuilt:
+            raise RuntimeError("rebuild did not complete")
+        
+        embed = discord.Embed(
+            title="✅ Success",
+            description="Invite statistics have been rebuilt from the join log!",
+            color=0x57F287
+        )
+        await ctx.send(embed=embed)
+        
+    except Exception as e:
+        logger.error(f"Error rebuilding statistics: {e}")
+        embed = discord.Embed(
+            title="❌ Error",
+            description="Failed to rebuild invite statistics.",
+            color=0xED4245
+        )
+        await ctx.send(embed=embed)
+
 @bot.event
 async def on_command_error(ctx, error):
     """Global error handler for commands"""
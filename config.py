@@ -4,7 +4,25 @@ import os
 BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN", "")
 LEADERBOARD_CHANNEL_ID = int(os.getenv("LEADERBOARD_CHANNEL_ID", "0"))
 LEADERBOARD_TIME = os.getenv("LEADERBOARD_TIME", "09:00")  # 24-hour format
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")  # "sqlite", or "memory" for ephemeral deployments
+MEMORY_SNAPSHOT_PATH = os.getenv("MEMORY_SNAPSHOT_PATH", "")  # File the memory backend snapshots to (empty to disable)
+MEMORY_SNAPSHOT_INTERVAL = float(os.getenv("MEMORY_SNAPSHOT_INTERVAL", "60"))  # Seconds after a change before snapshotting
 DATABASE_PATH = "invite_stats.db"
+DATABASE_SHARDS = int(os.getenv("DATABASE_SHARDS", "1"))  # Database files guilds are spread across, each with its own writer
+DATABASE_READERS = int(os.getenv("DATABASE_READERS", "4"))  # Reader connections (WAL allows them alongside the writer)
+LEADERBOARD_INDEX_GUILDS = int(os.getenv("LEADERBOARD_INDEX_GUILDS", "1000"))  # Guilds whose all-time leaderboard is kept in memory (0 to disable)
+LEADERBOARD_INDEX_CHECK_INTERVAL = float(os.getenv("LEADERBOARD_INDEX_CHECK_INTERVAL", "1"))  # Seconds an indexed leaderboard is trusted before checking for writes by other processes
+DATABASE_BUSY_TIMEOUT = float(os.getenv("DATABASE_BUSY_TIMEOUT", "5"))  # Seconds to wait on a locked database
+DAILY_STATS_RETENTION_DAYS = int(os.getenv("DAILY_STATS_RETENTION_DAYS", "90"))  # Days kept per day before rolling up into weeks
+WEEKLY_STATS_RETENTION_DAYS = int(os.getenv("WEEKLY_STATS_RETENTION_DAYS", "365"))  # Days kept per week before rolling up into months
+COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "500"))  # Rows moved per compaction transaction
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "5"))  # Guild invite lists fetched in parallel at startup
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "1000"))  # User names remembered for leaderboard embeds
+NAME_CACHE_TTL = float(os.getenv("NAME_CACHE_TTL", "3600"))  # Seconds a fetched user name is reused
+NAME_NEGATIVE_TTL = float(os.getenv("NAME_NEGATIVE_TTL", "300"))  # Seconds an unknown user is remembered as unknown
+NAME_FETCH_CONCURRENCY = int(os.getenv("NAME_FETCH_CONCURRENCY", "5"))  # User lookups in flight at once
+LEADERBOARD_CACHE_TTL = float(os.getenv("LEADERBOARD_CACHE_TTL", "300"))  # Seconds a leaderboard embed is reused while its guild sees no writes
+JOIN_DEBOUNCE_SECONDS = float(os.getenv("JOIN_DEBOUNCE_SECONDS", "1.5"))  # Window for attributing a burst of joins together
 
 # Bot permissions required
 REQUIRED_PERMISSIONS = [
@@ -1,184 +1,1359 @@
 import sqlite3
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Tuple, Optional
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Set, Tuple, Optional
 import logging
 
+from leaderboard_index import LeaderboardIndex
+from storage import TransactionError
+
 logger = logging.getLogger(__name__)
 
+# Day windows kept as maintained counters (invite_stats.uses_<n>d). A window of
+# n days covers dates >= today - n, matching get_daily_leaderboard.
+ROLLING_WINDOWS = (1, 7, 30)
+
+# Dates are stored as whole days since this epoch
+EPOCH = date(1970, 1, 1)
+
+def to_day(value: date) -> int:
+    """Day number of a date"""
+    return (value - EPOCH).days
+
+def from_day(day: int) -> date:
+    """Date of a day number"""
+    return EPOCH + timedelta(days=day)
+
+def join_day(joined_at: int) -> int:
+    """Local calendar day (daily_stats.day) of a join timestamp"""
+    return to_day(datetime.fromtimestamp(joined_at).date())
+
+def to_epoch(value: Optional[datetime]) -> Optional[int]:
+    """Epoch seconds of an optional datetime"""
+    return int(value.timestamp()) if value else None
+
+def _migrate_initial_schema(cursor: sqlite3.Cursor):
+    """Create the initial tables"""
+    # Table for tracking invite statistics
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS invite_stats (
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            total_invites INTEGER DEFAULT 0,
+            total_uses INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    """)
+    
+    # Table for tracking individual invites
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS invites (
+            invite_code TEXT PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            inviter_id INTEGER NOT NULL,
+            uses INTEGER DEFAULT 0,
+            max_uses INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+    """)
+    
+    # Table for tracking daily statistics
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            invites_used INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id, date)
+        )
+    """)
+
+def _migrate_leaderboard_indexes(cursor: sqlite3.Cursor):
+    """Add covering indexes for leaderboard and snapshot queries"""
+    # get_leaderboard reads the top rows of a guild straight from the index
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_invite_stats_leaderboard
+        ON invite_stats (guild_id, total_uses DESC, total_invites DESC, user_id)
+    """)
+    
+    # get_daily_leaderboard scans only the guild's recent days
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_daily_stats_guild_date
+        ON daily_stats (guild_id, date, user_id, invites_used)
+    """)
+    
+    # Snapshot reconciliation reads a guild's active invites
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_invites_guild_active
+        ON invites (guild_id, is_active)
+    """)
+
+def _migrate_rolling_windows(cursor: sqlite3.Cursor):
+    """Add rolling-window use counters to invite_stats"""
+    windows = (1, 7, 30)
+    for days in windows:
+        cursor.execute(f"ALTER TABLE invite_stats ADD COLUMN uses_{days}d INTEGER DEFAULT 0")
+    
+    # Small key/value table for database-wide state such as the window date
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    
+    # Backfill the counters from daily_stats as of today
+    today = datetime.now().date()
+    for days in windows:
+        cursor.execute(f"""
+            UPDATE invite_stats SET uses_{days}d = COALESCE((
+                SELECT SUM(invites_used) FROM daily_stats d
+                WHERE d.guild_id = invite_stats.guild_id AND d.user_id = invite_stats.user_id
+                AND d.date >= ?
+            ), 0)
+        """, ((today - timedelta(days=days)).strftime("%Y-%m-%d"),))
+    cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('window_date', ?)", (today.strftime("%Y-%m-%d"),))
+    
+    # The weekly leaderboard becomes a top-N read of this index
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_invite_stats_weekly
+        ON invite_stats (guild_id, uses_7d DESC, user_id)
+    """)
+
+def _migrate_join_log(cursor: sqlite3.Cursor):
+    """Add the append-only joins log"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS joins (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            member_id INTEGER,
+            inviter_id INTEGER NOT NULL,
+            invite_code TEXT,
+            joined_at INTEGER NOT NULL
+        )
+    """)
+    
+    # Each guild's joins are stored in time order, so any time range is one
+    # contiguous index scan
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_joins_guild_time
+        ON joins (guild_id, joined_at, inviter_id)
+    """)
+    
+    for action in ("UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS joins_append_only_{action.lower()}
+            BEFORE {action} ON joins
+            BEGIN
+                SELECT RAISE(ABORT, 'joins is append-only');
+            END
+        """)
+
+def _migrate_backfill_join_log(cursor: sqlite3.Cursor):
+    """Backfill the joins log with uses recorded before it existed"""
+    # Uses already in daily_stats but not in the log become member-less joins
+    # at noon of their day, so the log can rebuild every aggregate
+    cursor.execute("""
+        SELECT guild_id, inviter_id, joined_at FROM joins
+    """)
+    logged: Dict[Tuple[int, int, str], int] = {}
+    for guild_id, inviter_id, joined_at in cursor.fetchall():
+        key = (guild_id, inviter_id, datetime.fromtimestamp(joined_at).strftime("%Y-%m-%d"))
+        logged[key] = logged.get(key, 0) + 1
+    
+    cursor.execute("SELECT guild_id, user_id, date, invites_used FROM daily_stats")
+    backfill = []
+    for guild_id, user_id, date, invites_used in cursor.fetchall():
+        missing = (invites_used or 0) - logged.get((guild_id, user_id, date), 0)
+        if missing > 0:
+            noon = int(datetime.strptime(date, "%Y-%m-%d").replace(hour=12).timestamp())
+            backfill.extend([(guild_id, None, user_id, None, noon)] * missing)
+    
+    cursor.executemany("""
+        INSERT INTO joins (guild_id, member_id, inviter_id, invite_code, joined_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, backfill)
+
+def _migrate_rollup_tiers(cursor: sqlite3.Cursor):
+    """Add weekly and monthly rollup tiers for compacted daily stats"""
+    # Periods are keyed by their first day (a Monday, or the 1st of the month)
+    # so every tier compares dates the same way daily_stats does
+    for table, period in (("weekly_stats", "week"), ("monthly_stats", "month")):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                user_id INTEGER NOT NULL,
+                guild_id INTEGER NOT NULL,
+                {period} TEXT NOT NULL,
+                invites_used INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, guild_id, {period})
+            )
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_guild_{period}
+            ON {table} (guild_id, {period}, user_id, invites_used)
+        """)
+    
+    # Compaction finds old days without scanning the whole table
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_daily_stats_date
+        ON daily_stats (date)
+    """)
+
+def _migrate_compact_schema(cursor: sqlite3.Cursor):
+    """Move to the v2 layout: integer days/epoch seconds in guild-first WITHOUT ROWID tables"""
+    # Dates become days since 1970-01-01 and timestamps epoch seconds. Tables
+    # are clustered on their guild-first primary key so a guild's rows are
+    # stored together and need no separate rowid b-tree.
+    epoch_day = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+    epoch_seconds = "CAST(strftime('%s', {}) AS INTEGER)"
+    now = "(CAST(strftime('%s', 'now') AS INTEGER))"
+    
+    cursor.execute(f"""
+        CREATE TABLE invite_stats_v2 (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            total_invites INTEGER DEFAULT 0,
+            total_uses INTEGER DEFAULT 0,
+            uses_1d INTEGER DEFAULT 0,
+            uses_7d INTEGER DEFAULT 0,
+            uses_30d INTEGER DEFAULT 0,
+            last_updated INTEGER DEFAULT {now},
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        INSERT INTO invite_stats_v2
+        SELECT guild_id, user_id, total_invites, total_uses, uses_1d, uses_7d, uses_30d,
+               {epoch_seconds.format("last_updated")}
+        FROM invite_stats
+    """)
+    
+    cursor.execute(f"""
+        CREATE TABLE invites_v2 (
+            guild_id INTEGER NOT NULL,
+            invite_code TEXT NOT NULL,
+            inviter_id INTEGER NOT NULL,
+            uses INTEGER DEFAULT 0,
+            max_uses INTEGER,
+            created_at INTEGER DEFAULT {now},
+            expires_at INTEGER,
+            is_active BOOLEAN DEFAULT TRUE,
+            PRIMARY KEY (guild_id, invite_code)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO invites_v2
+        SELECT guild_id, invite_code, inviter_id, uses, max_uses,
+               {epoch_seconds.format("created_at")}, {epoch_seconds.format("expires_at")}, is_active
+        FROM invites
+    """)
+    
+    for table, period, new_period in (
+        ("daily_stats", "date", "day"),
+        ("weekly_stats", "week", "week"),
+        ("monthly_stats", "month", "month"),
+    ):
+        cursor.execute(f"""
+            CREATE TABLE {table}_v2 (
+                guild_id INTEGER NOT NULL,
+                {new_period} INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                invites_used INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, {new_period}, user_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute(f"""
+            INSERT INTO {table}_v2
+            SELECT guild_id, {epoch_day.format(period)}, user_id, invites_used
+            FROM {table}
+        """)
+    
+    cursor.execute("CREATE TABLE meta_v2 (key TEXT PRIMARY KEY, value) WITHOUT ROWID")
+    cursor.execute(f"""
+        INSERT INTO meta_v2
+        SELECT key, CASE WHEN key = 'window_date' THEN {epoch_day.format("value")} ELSE value END
+        FROM meta
+    """)
+    
+    for table in ("invite_stats", "invites", "daily_stats", "weekly_stats", "monthly_stats", "meta"):
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_v2 RENAME TO {table}")
+    
+    # Secondary indexes the v2 primary keys do not already cover
+    cursor.execute("""
+        CREATE INDEX idx_invite_stats_leaderboard
+        ON invite_stats (guild_id, total_uses DESC, total_invites DESC, user_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX idx_invite_stats_weekly
+        ON invite_stats (guild_id, uses_7d DESC, user_id)
+    """)
+    cursor.execute("CREATE INDEX idx_daily_stats_day ON daily_stats (day)")
+    cursor.execute("CREATE INDEX idx_weekly_stats_week ON weekly_stats (week)")
+
+def _migrate_user_directory(cursor: sqlite3.Cursor):
+    """Add the per-guild directory of known user names"""
+    # Lets leaderboards name departed users without asking Discord again
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            name TEXT,
+            display_name TEXT,
+            left_server BOOLEAN DEFAULT FALSE,
+            updated_at INTEGER,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID
+    """)
+
+# Schema migrations in order. PRAGMA user_version records how many have been
+# applied; add new migrations to the end and never change shipped ones.
+MIGRATIONS = [
+    _migrate_initial_schema,
+    _migrate_leaderboard_indexes,
+    _migrate_rolling_windows,
+    _migrate_join_log,
+    _migrate_backfill_join_log,
+    _migrate_rollup_tiers,
+    _migrate_compact_schema,
+    _migrate_user_directory,
+]
+
+def with_user_names(query: str, params: tuple, guild_id: int, order_by: str) -> Tuple[str, tuple]:
+    """Wrap a leaderboard query so each row also carries the user's stored
+    (name, display_name, left_server), NULL when the user is not in the directory"""
+    return f"""
+        SELECT s.*, u.name, u.display_name, u.left_server
+        FROM ({query}) s
+        LEFT JOIN users u ON u.guild_id = ? AND u.user_id = s.user_id
+        ORDER BY {order_by}
+    """, (*params, guild_id)
+
+class _Connection(sqlite3.Connection):
+    """Connection whose commits are held back while a unit of work is applied
+    
+    Callbacks registered with after_commit run once the current transaction
+    commits and are dropped if it rolls back.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deferred = False
+        self.failed = False
+        self._on_commit: List[Tuple] = []
+    
+    def after_commit(self, func, *args):
+        self._on_commit.append((func, args))
+    
+    def commit(self):
+        if not self.deferred:
+            super().commit()
+            callbacks, self._on_commit = self._on_commit, []
+            for func, args in callbacks:
+                func(*args)
+    
+    def rollback(self):
+        super().rollback()
+        self._on_commit.clear()
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.deferred:
+            if exc_type is None:
+                self.commit()
+            else:
+                self._on_commit.clear()
+            return super().__exit__(exc_type, exc_value, traceback)
+        # Leave the transaction open for the unit; a failed write rolls it all back
+        if exc_type is not None:
+            self.failed = True
+        return False
+
+class UnitOfWork:
+    """Writes queued by InviteDatabase calls made inside `db.transaction()`
+    
+    Writes are kept per database, so one unit can span several shards; each
+    shard's writes commit together on its own writer.
+    """
+    
+    def __init__(self):
+        self.writes: Dict["InviteDatabase", List[Tuple]] = {}
+        # Guilds whose statistics the queued writes change, per database
+        self.guilds: Dict["InviteDatabase", Set[int]] = {}
+        self.open = True
+
+# The unit of work of the current task, if it is inside db.transaction()
+_current_unit: ContextVar[Optional[UnitOfWork]] = ContextVar("invite_db_unit", default=None)
+
 class InviteDatabase:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, readers: int = 4, busy_timeout: float = 5.0,
+                 cached_statements: int = 256, flush_size: int = 100,
+                 flush_interval: float = 2.0, max_staleness: float = 0.0,
+                 index_guilds: int = 1000, index_check_interval: float = 1.0):
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        
+        # Write-behind buffer of joins: (guild_id, member_id, inviter_id, invite_code, joined_at).
+        # It is flushed once it holds flush_size joins or flush_interval seconds
+        # after the first buffered join; reads flush it first when the oldest
+        # buffered join is older than max_staleness seconds.
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_staleness = max_staleness
+        self._pending_joins: List[Tuple[int, Optional[int], int, Optional[str], int]] = []
+        self._pending_since: Optional[float] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        
+        # Called with a guild id after that guild's statistics changed
+        self._write_listeners: List[Callable[[int], None]] = []
+        
+        # All-time leaderboards of recently read guilds, kept in step with
+        # committed writes (None when index_guilds is 0). Every
+        # index_check_interval seconds a read first checks that no other
+        # process has written to the file.
+        self._index = LeaderboardIndex(index_guilds) if index_guilds > 0 else None
+        self.index_check_interval = index_check_interval
+        # Guild loads and checks queued on the writer, at most one per guild
+        self._index_refreshes: Dict[int, asyncio.Task] = {}
+        
+        # Date the rolling-window counters were last moved forward to
+        self._window_date = None
+        
+        # All SQLite work runs off the event loop. Writes are serialized on a
+        # single writer thread; reads run on a small pool so that leaderboard
+        # queries never queue behind invite writes (WAL lets them run side by side).
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invite-db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="invite-db-reader")
+        
+        # Each database thread keeps one long-lived connection
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        
         self.init_database()
     
+    @property
+    def shards(self) -> List["InviteDatabase"]:
+        """The database files holding guild data, each with its own join log"""
+        return [self]
+    
+    def shard_for(self, guild_id: int) -> "InviteDatabase":
+        """The database file holding a guild"""
+        return self
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection configured for concurrent readers and a single writer"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=_Connection
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        return conn
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get the persistent connection owned by the current database thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    async def _write(self, func, *args):
+        """Run a blocking write function on the writer thread
+        
+        Inside db.transaction() the write is queued on the unit of work instead
+        and None is returned.
+        """
+        unit = _current_unit.get()
+        if unit is not None and unit.open:
+            unit.writes.setdefault(self, []).append((func, args))
+            return None
+        return await self._run_write(func, *args)
+    
+    async def _write_stats(self, guild_id: int, func, *args):
+        """_write for a write that changes a guild's statistics
+        
+        Write listeners hear about the guild once the write is committed (at
+        the end of the unit of work when one is open).
+        """
+        unit = _current_unit.get()
+        if unit is not None and unit.open:
+            unit.guilds.setdefault(self, set()).add(guild_id)
+            return await self._write(func, *args)
+        
+        result = await self._run_write(func, *args)
+        self._stats_changed(guild_id)
+        return result
+    
+    def add_write_listener(self, listener: Callable[[int], None]):
+        """Call listener(guild_id) whenever a guild's invite statistics change"""
+        self._write_listeners.append(listener)
+    
+    def _stats_changed(self, guild_id: int):
+        for listener in self._write_listeners:
+            try:
+                listener(guild_id)
+            except Exception as e:
+                logger.error(f"Error in database write listener: {e}")
+    
+    async def _run_write(self, func, *args):
+        """Run a blocking write function on the writer thread right away"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, func, *args)
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Group the writes made inside the block into a single commit
+        
+        Write calls in the block are queued rather than run, then applied
+        together in one transaction on the writer thread when the block exits
+        (one per shard when sharded); if any of them fails, none are kept and
+        TransactionError is raised. If the block raises, the queued
+        writes are dropped. Queued writes return None and reads inside the
+        block do not see them yet. Nested blocks join the outer one.
+        """
+        unit = _current_unit.get()
+        if unit is not None and unit.open:
+            yield unit
+            return
+        
+        unit = UnitOfWork()
+        token = _current_unit.set(unit)
+        try:
+            yield unit
+        finally:
+            unit.open = False
+            _current_unit.reset(token)
+        
+        failed = []
+        for db, writes in unit.writes.items():
+            if not await db._run_write(db._apply_unit, writes):
+                failed.append(db.db_path)
+                continue
+            for guild_id in unit.guilds.get(db, ()):
+                db._stats_changed(guild_id)
+        
+        if failed:
+            raise TransactionError(f"Unit of work rolled back in {', '.join(failed)}")
+    
+    def _apply_unit(self, writes: List[Tuple]) -> bool:
+        conn = self._connection()
+        conn.deferred = True
+        conn.failed = False
+        try:
+            for func, args in writes:
+                func(*args)
+        except Exception:
+            conn.failed = True
+            raise
+        finally:
+            conn.deferred = False
+            if conn.failed:
+                conn.rollback()
+        
+        if conn.failed:
+            logger.error(f"Rolled back a unit of {len(writes)} writes after a failed write")
+            return False
+        try:
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error committing unit of work: {e}")
+            return False
+    
+    async def _read(self, func, *args):
+        """Run a blocking read function on a reader thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, func, *args)
+    
+    async def close(self):
+        """Flush buffered writes, stop the database threads and close connections"""
+        await self.flush()
+        if self._index_refreshes:
+            await asyncio.gather(*self._index_refreshes.values())
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.shutdown)
+        await loop.run_in_executor(None, self._readers.shutdown)
+        
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+    
     def init_database(self):
-        """Initialize the database with required tables"""
+        """Initialize the database, applying any schema migrations it has not run yet"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Table for tracking invite statistics
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS invite_stats (
-                        user_id INTEGER NOT NULL,
-                        guild_id INTEGER NOT NULL,
-                        total_invites INTEGER DEFAULT 0,
-                        total_uses INTEGER DEFAULT 0,
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        PRIMARY KEY (user_id, guild_id)
-                    )
-                """)
-                
-                # Table for tracking individual invites
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS invites (
-                        invite_code TEXT PRIMARY KEY,
-                        guild_id INTEGER NOT NULL,
-                        inviter_id INTEGER NOT NULL,
-                        uses INTEGER DEFAULT 0,
-                        max_uses INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        expires_at TIMESTAMP,
-                        is_active BOOLEAN DEFAULT TRUE
-                    )
-                """)
-                
-                # Table for tracking daily statistics
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS daily_stats (
-                        user_id INTEGER NOT NULL,
-                        guild_id INTEGER NOT NULL,
-                        date TEXT NOT NULL,
-                        invites_used INTEGER DEFAULT 0,
-                        PRIMARY KEY (user_id, guild_id, date)
-                    )
-                """)
-                
-                conn.commit()
-                logger.info("Database initialized successfully")
+            conn = self._connect()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            
+            if version > len(MIGRATIONS):
+                logger.warning(f"Database schema version {version} is newer than this bot ({len(MIGRATIONS)})")
+            
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                # Each migration and its version bump commit together
+                conn.execute("BEGIN")
+                try:
+                    migration(conn.cursor())
+                    conn.execute(f"PRAGMA user_version = {number}")
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    raise
+                logger.info(f"Applied database migration {number}: {migration.__doc__}")
+            
+            # Compaction frees pages with incremental vacuum; switching an
+            # existing file over needs one full VACUUM
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                logger.info("Enabled incremental vacuum")
+            
+            logger.info("Database initialized successfully")
+            conn.close()
         except sqlite3.Error as e:
             logger.error(f"Database initialization error: {e}")
     
     async def add_invite(self, invite_code: str, guild_id: int, inviter_id: int, 
                         max_uses: Optional[int] = None, expires_at: Optional[datetime] = None):
         """Add a new invite to the database"""
+        await self._write(self._add_invite, invite_code, guild_id, inviter_id, max_uses, expires_at)
+    
+    def _add_invite(self, invite_code: str, guild_id: int, inviter_id: int, 
+                        max_uses: Optional[int] = None, expires_at: Optional[datetime] = None):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT OR REPLACE INTO invites 
                     (invite_code, guild_id, inviter_id, max_uses, expires_at)
                     VALUES (?, ?, ?, ?, ?)
-                """, (invite_code, guild_id, inviter_id, max_uses, expires_at))
+                """, (invite_code, guild_id, inviter_id, max_uses, to_epoch(expires_at)))
                 conn.commit()
                 logger.debug(f"Added invite {invite_code} for user {inviter_id}")
         except sqlite3.Error as e:
             logger.error(f"Error adding invite: {e}")
     
-    async def update_invite_usage(self, invite_code: str, new_uses: int):
-        """Update invite usage count"""
+    async def add_invites_bulk(self, guild_id: int,
+                               invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]):
+        """Store a guild's invite snapshot (code, inviter_id, uses, max_uses, expires_at) in one transaction"""
+        await self._write(self._add_invites_bulk, guild_id, invites)
+    
+    def _add_invites_bulk(self, guild_id: int,
+                          invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
+                self._upsert_invites(conn.cursor(), guild_id, invites)
+                conn.commit()
+                logger.debug(f"Stored {len(invites)} invites for guild {guild_id}")
+        except sqlite3.Error as e:
+            logger.error(f"Error adding invites: {e}")
+    
+    def _upsert_invites(self, cursor: sqlite3.Cursor, guild_id: int,
+                        invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]):
+        cursor.executemany("""
+            INSERT INTO invites 
+            (invite_code, guild_id, inviter_id, uses, max_uses, expires_at, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, TRUE)
+            ON CONFLICT (guild_id, invite_code) DO UPDATE
+            SET inviter_id = excluded.inviter_id,
+                uses = excluded.uses, max_uses = excluded.max_uses,
+                expires_at = excluded.expires_at, is_active = TRUE
+        """, [
+            (code, guild_id, inviter_id, uses, max_uses, to_epoch(expires_at))
+            for code, inviter_id, uses, max_uses, expires_at in invites
+        ])
+    
+    async def reconcile_invites(self, guild_id: int,
+                                invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]) -> Dict[int, int]:
+        """Store a freshly fetched invite snapshot, crediting uses missed since the stored one
+        
+        Uses that grew while the bot was offline are credited to each invite's
+        inviter in the same transaction that stores the new snapshot. Stored
+        invites missing from the snapshot are marked inactive. Returns the
+        credited uses per inviter.
+        """
+        return await self._write_stats(guild_id, self._reconcile_invites, guild_id, invites)
+    
+    def _reconcile_invites(self, guild_id: int,
+                           invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]) -> Dict[int, int]:
+        try:
+            now = int(time.time())
+            
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                    UPDATE invites SET uses = ? WHERE invite_code = ?
-                """, (new_uses, invite_code))
+                    SELECT invite_code, uses FROM invites
+                    WHERE guild_id = ? AND is_active = TRUE
+                """, (guild_id,))
+                stored_uses = dict(cursor.fetchall())
+                
+                missed: Dict[int, int] = {}
+                missed_joins = []
+                for code, inviter_id, uses, _, _ in invites:
+                    delta = uses - (stored_uses.get(code) or 0)
+                    if code in stored_uses and delta > 0 and inviter_id:
+                        missed[inviter_id] = missed.get(inviter_id, 0) + delta
+                        missed_joins.extend([(guild_id, None, inviter_id, code, now)] * delta)
+                
+                if missed_joins:
+                    self._apply_joins(cursor, missed_joins)
+                
+                self._upsert_invites(cursor, guild_id, invites)
+                
+                fetched = {invite[0] for invite in invites}
+                cursor.executemany("""
+                    UPDATE invites SET is_active = FALSE WHERE guild_id = ? AND invite_code = ?
+                """, [(guild_id, code) for code in stored_uses if code not in fetched])
+                
+                conn.commit()
+                if missed:
+                    logger.info(f"Credited {sum(missed.values())} missed invite uses to {len(missed)} inviters in guild {guild_id}")
+                return missed
+        except sqlite3.Error as e:
+            logger.error(f"Error reconciling invites: {e}")
+            return {}
+    
+    async def get_active_invites(self, guild_ids: Optional[List[int]] = None) -> List[Tuple[int, str, int, int, Optional[int], Optional[int]]]:
+        """Get stored active invites (guild_id, code, inviter_id, uses, max_uses, expires_at), optionally for some guilds"""
+        return await self._read(self._get_active_invites, guild_ids)
+    
+    def _get_active_invites(self, guild_ids: Optional[List[int]] = None) -> List[Tuple[int, str, int, int, Optional[int], Optional[int]]]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT guild_id, invite_code, inviter_id, uses, max_uses, expires_at
+                    FROM invites
+                    WHERE is_active = TRUE
+                """)
+                rows = cursor.fetchall()
+                if guild_ids is not None:
+                    wanted = set(guild_ids)
+                    rows = [row for row in rows if row[0] in wanted]
+                return rows
+        except sqlite3.Error as e:
+            logger.error(f"Error getting active invites: {e}")
+            return []
+    
+    async def update_invite_usage(self, invite_code: str, new_uses: int, guild_id: Optional[int] = None):
+        """Update invite usage count"""
+        await self._write(self._update_invite_usage, invite_code, new_uses, guild_id)
+    
+    def _update_invite_usage(self, invite_code: str, new_uses: int, guild_id: Optional[int] = None):
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                if guild_id is None:
+                    cursor.execute("""
+                        UPDATE invites SET uses = ? WHERE invite_code = ?
+                    """, (new_uses, invite_code))
+                else:
+                    cursor.execute("""
+                        UPDATE invites SET uses = ? WHERE guild_id = ? AND invite_code = ?
+                    """, (new_uses, guild_id, invite_code))
                 conn.commit()
                 logger.debug(f"Updated invite {invite_code} usage to {new_uses}")
         except sqlite3.Error as e:
             logger.error(f"Error updating invite usage: {e}")
     
-    async def remove_invite(self, invite_code: str):
+    async def remove_invite(self, invite_code: str, guild_id: Optional[int] = None):
         """Mark an invite as inactive"""
+        await self._write(self._remove_invite, invite_code, guild_id)
+    
+    def _remove_invite(self, invite_code: str, guild_id: Optional[int] = None):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE invites SET is_active = FALSE WHERE invite_code = ?
-                """, (invite_code,))
+                if guild_id is None:
+                    cursor.execute("""
+                        UPDATE invites SET is_active = FALSE WHERE invite_code = ?
+                    """, (invite_code,))
+                else:
+                    cursor.execute("""
+                        UPDATE invites SET is_active = FALSE WHERE guild_id = ? AND invite_code = ?
+                    """, (guild_id, invite_code))
                 conn.commit()
                 logger.debug(f"Marked invite {invite_code} as inactive")
         except sqlite3.Error as e:
             logger.error(f"Error removing invite: {e}")
     
-    async def record_invite_use(self, guild_id: int, inviter_id: int):
+    async def record_invite_use(self, guild_id: int, inviter_id: int, count: int = 1):
         """Record that an invite was used"""
-        try:
-            today = datetime.now().strftime("%Y-%m-%d")
+        await self.record_joins(guild_id, [(None, inviter_id, None)] * count)
+    
+    async def record_joins(self, guild_id: int, joins: List[Tuple[Optional[int], int, Optional[str]]]):
+        """Record attributed joins (member_id, inviter_id, invite_code)
+        
+        Each join becomes a row in the append-only joins log and one use for
+        its inviter. Inside db.transaction() they commit with the unit; outside
+        one they are buffered in memory and written in batches (see flush).
+        The tracker always records joins in a unit, together with the invite
+        snapshot they were attributed from, so the buffer only serves direct
+        callers such as scripts and benchmarks.
+        """
+        if not joins:
+            return
+        
+        joined_at = int(time.time())
+        rows = [
+            (guild_id, member_id, inviter_id, invite_code, joined_at)
+            for member_id, inviter_id, invite_code in joins
+        ]
+        
+        unit = _current_unit.get()
+        if unit is not None and unit.open:
+            await self._write_stats(guild_id, self._flush_joins, rows)
+            return
+        
+        self._pending_joins.extend(rows)
+        # Reads flush buffered joins before they run, so they count as changed now
+        self._stats_changed(guild_id)
+        
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        
+        if len(self._pending_joins) >= self.flush_size:
+            await self.flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._schedule_flush)
+    
+    def _schedule_flush(self):
+        """Start a background flush once the flush interval has passed"""
+        self._flush_handle = None
+        self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+    
+    async def flush(self):
+        """Write all buffered joins in a single transaction"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        async with self._flush_lock:
+            if not self._pending_joins:
+                self._pending_since = None
+                return
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Update total stats
-                cursor.execute("""
-                    INSERT OR IGNORE INTO invite_stats (user_id, guild_id, total_uses)
-                    VALUES (?, ?, 0)
-                """, (inviter_id, guild_id))
-                
-                cursor.execute("""
-                    UPDATE invite_stats 
-                    SET total_uses = total_uses + 1, last_updated = CURRENT_TIMESTAMP
-                    WHERE user_id = ? AND guild_id = ?
-                """, (inviter_id, guild_id))
-                
-                # Update daily stats
-                cursor.execute("""
-                    INSERT OR IGNORE INTO daily_stats (user_id, guild_id, date, invites_used)
-                    VALUES (?, ?, ?, 0)
-                """, (inviter_id, guild_id, today))
-                
+            batch = self._pending_joins
+            self._pending_joins = []
+            self._pending_since = None
+            
+            # Buffered joins are never part of a caller's unit of work
+            if not await self._run_write(self._flush_joins, batch):
+                # Keep the joins so the next flush retries them
+                self._pending_joins[:0] = batch
+                if self._pending_since is None:
+                    self._pending_since = time.monotonic()
+                return
+            
+            for guild_id in {join[0] for join in batch}:
+                self._stats_changed(guild_id)
+    
+    async def _ensure_fresh(self):
+        """Flush buffered joins that are older than the allowed read staleness"""
+        if self._pending_since is not None and time.monotonic() - self._pending_since >= self.max_staleness:
+            await self.flush()
+        elif self._flush_lock.locked():
+            # Wait for an in-progress flush so reads see its rows
+            async with self._flush_lock:
+                pass
+    
+    def _flush_joins(self, batch: List[Tuple[int, Optional[int], int, Optional[str], int]]) -> bool:
+        try:
+            with self._connection() as conn:
+                self._apply_joins(conn.cursor(), batch)
+                conn.commit()
+                logger.debug(f"Flushed {len(batch)} joins")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error recording invite uses: {e}")
+            return False
+    
+    def _apply_joins(self, cursor: sqlite3.Cursor, joins: List[Tuple[int, Optional[int], int, Optional[str], int]]):
+        """Append joins to the log and count them as uses in the stats tables"""
+        cursor.executemany("""
+            INSERT INTO joins (guild_id, member_id, inviter_id, invite_code, joined_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, joins)
+        
+        uses: Dict[Tuple[int, int, str], int] = {}
+        for guild_id, _, inviter_id, _, joined_at in joins:
+            key = (guild_id, inviter_id, join_day(joined_at))
+            uses[key] = uses.get(key, 0) + 1
+        self._apply_invite_uses(cursor, uses)
+    
+    def _apply_invite_uses(self, cursor: sqlite3.Cursor, batch: Dict[Tuple[int, int, int], int]):
+        """Add (guild_id, inviter_id, day) -> uses increments to the stats tables"""
+        today = to_day(self._roll_windows(cursor))
+        cutoffs = [today - days for days in ROLLING_WINDOWS]
+        
+        # Per inviter: [total, uses in each rolling window...]
+        totals: Dict[Tuple[int, int], List[int]] = {}
+        for (guild_id, inviter_id, day), count in batch.items():
+            row = totals.setdefault((guild_id, inviter_id), [0] * (1 + len(ROLLING_WINDOWS)))
+            row[0] += count
+            for i, cutoff in enumerate(cutoffs, start=1):
+                if day >= cutoff:
+                    row[i] += count
+        
+        # Update total stats
+        columns = ", ".join(f"uses_{days}d" for days in ROLLING_WINDOWS)
+        updates = ", ".join(f"uses_{days}d = uses_{days}d + excluded.uses_{days}d" for days in ROLLING_WINDOWS)
+        placeholders = ", ".join("?" for _ in ROLLING_WINDOWS)
+        cursor.executemany(f"""
+            INSERT INTO invite_stats (guild_id, user_id, total_uses, {columns})
+            VALUES (?, ?, ?, {placeholders})
+            ON CONFLICT (guild_id, user_id) DO UPDATE
+            SET total_uses = total_uses + excluded.total_uses, {updates},
+                last_updated = CAST(strftime('%s', 'now') AS INTEGER)
+        """, [(guild_id, inviter_id, *row) for (guild_id, inviter_id), row in totals.items()])
+        if self._index is not None:
+            cursor.connection.after_commit(
+                self._index.add_uses, {key: row[0] for key, row in totals.items()}
+            )
+        
+        # Update daily stats
+        cursor.executemany("""
+            INSERT INTO daily_stats (guild_id, day, user_id, invites_used)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (guild_id, day, user_id) DO UPDATE
+            SET invites_used = invites_used + excluded.invites_used
+        """, [(guild_id, day, inviter_id, count) for (guild_id, inviter_id, day), count in batch.items()])
+    
+    def _roll_windows(self, cursor: sqlite3.Cursor) -> date:
+        """Move the rolling-window counters forward to today, returning today's date
+        
+        Days that left a window since the last rollover are subtracted from it.
+        """
+        today = datetime.now().date()
+        if self._window_date == today:
+            return today
+        
+        cursor.execute("SELECT value FROM meta WHERE key = 'window_date'")
+        row = cursor.fetchone()
+        window_day = int(row[0]) if row else to_day(today)
+        
+        if window_day < to_day(today):
+            for days in ROLLING_WINDOWS:
+                # Days in [window_day - days, today - days) have aged out
                 cursor.execute("""
-                    UPDATE daily_stats 
-                    SET invites_used = invites_used + 1
-                    WHERE user_id = ? AND guild_id = ? AND date = ?
-                """, (inviter_id, guild_id, today))
-                
+                    SELECT guild_id, user_id, SUM(invites_used) FROM daily_stats
+                    WHERE day >= ? AND day < ?
+                    GROUP BY guild_id, user_id
+                """, (window_day - days, to_day(today) - days))
+                cursor.executemany(f"""
+                    UPDATE invite_stats SET uses_{days}d = MAX(0, uses_{days}d - ?)
+                    WHERE guild_id = ? AND user_id = ?
+                """, [(aged, guild_id, user_id) for guild_id, user_id, aged in cursor.fetchall()])
+            
+            cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('window_date', ?)", (to_day(today),))
+            logger.info(f"Rolled invite windows forward from {from_day(window_day)} to {today}")
+        
+        # Only once committed: a rolled-back batch undoes the rollover with it
+        cursor.connection.after_commit(setattr, self, "_window_date", today)
+        return today
+    
+    def _roll_windows_now(self):
+        try:
+            with self._connection() as conn:
+                self._roll_windows(conn.cursor())
                 conn.commit()
-                logger.debug(f"Recorded invite use for user {inviter_id}")
         except sqlite3.Error as e:
-            logger.error(f"Error recording invite use: {e}")
+            logger.error(f"Error rolling invite windows: {e}")
     
     async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Tuple[int, int, int]]:
         """Get invite leaderboard for a guild"""
+        await self._ensure_fresh()
+        rows = await self._indexed_leaderboard(guild_id, limit)
+        if rows is not None:
+            return rows
+        return await self._read(self._get_leaderboard, guild_id, limit)
+    
+    async def get_leaderboard_with_names(self, guild_id: int, limit: int = 10) -> List[Tuple]:
+        """Get invite leaderboard rows with the user's stored (name, display_name, left_server) appended
+        
+        Unlike get_leaderboard, a failed read raises sqlite3.Error rather than
+        returning no rows.
+        """
+        await self._ensure_fresh()
+        rows = await self._indexed_leaderboard(guild_id, limit)
+        if rows is None:
+            return await self._read(self._get_leaderboard, guild_id, limit, True)
+        if not rows:
+            return []
+        return await self._read(self._get_stored_names, guild_id, rows)
+    
+    async def _indexed_leaderboard(self, guild_id: int, limit: int) -> Optional[List[Tuple[int, int, int]]]:
+        """Top rows from the leaderboard index
+        
+        Returns None when the index is disabled, or the guild is not loaded or
+        is due for its data_version check; the caller then reads from SQL on
+        a reader while the load or check waits its turn on the writer, so a
+        read never queues behind writes.
+        """
+        if self._index is None:
+            return None
+        rows = self._index.top(guild_id, limit, self.index_check_interval)
+        if rows is None and guild_id not in self._index_refreshes:
+            self._index_refreshes[guild_id] = asyncio.create_task(self._refresh_index(guild_id))
+        return rows
+    
+    async def _refresh_index(self, guild_id: int):
+        # Loading on the writer thread means no commit can land between
+        # reading the rows and the index taking over from them
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            await self._run_write(self._load_index, guild_id)
+        finally:
+            del self._index_refreshes[guild_id]
+    
+    def _load_index(self, guild_id: int) -> bool:
+        """Load a guild into the index, or confirm the loaded rows are current
+        
+        The writer connection's data_version only changes when another
+        connection commits, so a change means a write the index never saw.
+        """
+        try:
+            with self._connection() as conn:
                 cursor = conn.cursor()
+                data_version = cursor.execute("PRAGMA data_version").fetchone()[0]
+                if self._index.confirm(guild_id, data_version):
+                    return True
+                
                 cursor.execute("""
                     SELECT user_id, total_invites, total_uses
                     FROM invite_stats
                     WHERE guild_id = ?
+                """, (guild_id,))
+                self._index.load(guild_id, cursor.fetchall(), data_version)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error loading leaderboard index: {e}")
+            return False
+    
+    def _get_stored_names(self, guild_id: int, rows: List[Tuple[int, int, int]]) -> List[Tuple]:
+        """Append each user's stored (name, display_name, left_server) to leaderboard rows"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ", ".join("?" for _ in rows)
+                cursor.execute(f"""
+                    SELECT user_id, name, display_name, left_server
+                    FROM users
+                    WHERE guild_id = ? AND user_id IN ({placeholders})
+                """, (guild_id, *(row[0] for row in rows)))
+                stored = {user_id: names for user_id, *names in cursor.fetchall()}
+                return [(*row, *stored.get(row[0], (None, None, None))) for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting leaderboard: {e}")
+            raise
+    
+    def _get_leaderboard(self, guild_id: int, limit: int = 10, names: bool = False) -> List[Tuple]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                query, params = """
+                    SELECT user_id, total_invites, total_uses
+                    FROM invite_stats
+                    WHERE guild_id = ?
                     ORDER BY total_uses DESC, total_invites DESC
                     LIMIT ?
-                """, (guild_id, limit))
+                """, (guild_id, limit)
+                if names:
+                    query, params = with_user_names(query, params, guild_id, "s.total_uses DESC, s.total_invites DESC")
+                cursor.execute(query, params)
                 return cursor.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Error getting leaderboard: {e}")
+            # Named reads feed cached embeds, which must not cache a failure as "no data"
+            if names:
+                raise
             return []
     
     async def get_daily_leaderboard(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple[int, int]]:
         """Get daily invite leaderboard for specified number of days"""
+        return await self._daily_leaderboard(guild_id, days, limit, False)
+    
+    async def get_daily_leaderboard_with_names(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple]:
+        """Get daily leaderboard rows with the user's stored (name, display_name, left_server) appended
+        
+        A failed read raises sqlite3.Error, as get_leaderboard_with_names does.
+        """
+        return await self._daily_leaderboard(guild_id, days, limit, True)
+    
+    async def _daily_leaderboard(self, guild_id: int, days: int, limit: int, names: bool) -> List[Tuple]:
+        await self._ensure_fresh()
+        if days in ROLLING_WINDOWS:
+            if self._window_date != datetime.now().date():
+                await self._run_write(self._roll_windows_now)
+            return await self._read(self._get_window_leaderboard, guild_id, days, limit, names)
+        return await self._read(self._get_daily_leaderboard, guild_id, days, limit, names)
+    
+    def _get_window_leaderboard(self, guild_id: int, days: int, limit: int, names: bool = False) -> List[Tuple]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                query, params = f"""
+                    SELECT user_id, uses_{days}d
+                    FROM invite_stats
+                    WHERE guild_id = ? AND uses_{days}d > 0
+                    ORDER BY uses_{days}d DESC
+                    LIMIT ?
+                """, (guild_id, limit)
+                if names:
+                    query, params = with_user_names(query, params, guild_id, f"s.uses_{days}d DESC")
+                cursor.execute(query, params)
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting daily leaderboard: {e}")
+            if names:
+                raise
+            return []
+    
+    def _get_daily_leaderboard(self, guild_id: int, days: int = 7, limit: int = 10, names: bool = False) -> List[Tuple]:
         try:
-            cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+            cutoff = to_day(datetime.now().date()) - days
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
+                # Compacted days live in the weekly/monthly tiers; a rolled-up
+                # period counts when it starts on or after the cutoff
+                query, params = """
                     SELECT user_id, SUM(invites_used) as recent_uses
-                    FROM daily_stats
-                    WHERE guild_id = ? AND date >= ?
+                    FROM (
+                        SELECT user_id, invites_used FROM daily_stats
+                        WHERE guild_id = ? AND day >= ?
+                        UNION ALL
+                        SELECT user_id, invites_used FROM weekly_stats
+                        WHERE guild_id = ? AND week >= ?
+                        UNION ALL
+                        SELECT user_id, invites_used FROM monthly_stats
+                        WHERE guild_id = ? AND month >= ?
+                    )
                     GROUP BY user_id
                     ORDER BY recent_uses DESC
                     LIMIT ?
-                """, (guild_id, cutoff_date, limit))
+                """, (guild_id, cutoff, guild_id, cutoff, guild_id, cutoff, limit)
+                if names:
+                    query, params = with_user_names(query, params, guild_id, "s.recent_uses DESC")
+                cursor.execute(query, params)
                 return cursor.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Error getting daily leaderboard: {e}")
+            if names:
+                raise
+            return []
+    
+    async def compact_stats(self, daily_retention_days: int = 90, weekly_retention_days: int = 365,
+                            batch_size: int = 500) -> int:
+        """Roll old daily_stats rows into weekly, and old weeks into monthly, then reclaim space
+        
+        Rows move in batches of batch_size, each its own short transaction on
+        the writer thread, so live writes are never blocked for long. Days still
+        inside a rolling window are always kept. Returns the rows compacted.
+        """
+        daily_retention_days = max(daily_retention_days, max(ROLLING_WINDOWS) + 1)
+        weekly_retention_days = max(weekly_retention_days, daily_retention_days)
+        
+        compacted = 0
+        for tier, retention_days in (("daily", daily_retention_days), ("weekly", weekly_retention_days)):
+            while True:
+                moved = await self._write(self._compact_batch, tier, retention_days, batch_size)
+                compacted += moved
+                if moved < batch_size:
+                    break
+        
+        await self._write(self._incremental_vacuum)
+        if compacted:
+            logger.info(f"Compacted {compacted} statistics rows into rollup tiers")
+        return compacted
+    
+    def _compact_batch(self, tier: str, retention_days: int, batch_size: int) -> int:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                # Windows must be current before any of their days disappear
+                today = self._roll_windows(cursor)
+                cutoff = to_day(today) - retention_days
+                
+                if tier == "daily":
+                    source, period, target, target_period = "daily_stats", "day", "weekly_stats", "week"
+                else:
+                    source, period, target, target_period = "weekly_stats", "week", "monthly_stats", "month"
+                
+                cursor.execute(f"""
+                    SELECT guild_id, {period}, user_id, invites_used FROM {source}
+                    WHERE {period} < ?
+                    LIMIT ?
+                """, (cutoff, batch_size))
+                rows = cursor.fetchall()
+                
+                rollup: Dict[Tuple[int, int, int], int] = {}
+                for guild_id, start, user_id, invites_used in rows:
+                    day = from_day(start)
+                    if tier == "daily":
+                        day -= timedelta(days=day.weekday())
+                    else:
+                        day = day.replace(day=1)
+                    key = (guild_id, to_day(day), user_id)
+                    rollup[key] = rollup.get(key, 0) + (invites_used or 0)
+                
+                cursor.executemany(f"""
+                    INSERT INTO {target} (guild_id, {target_period}, user_id, invites_used)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (guild_id, {target_period}, user_id) DO UPDATE
+                    SET invites_used = invites_used + excluded.invites_used
+                """, [(*key, count) for key, count in rollup.items()])
+                cursor.executemany(f"""
+                    DELETE FROM {source} WHERE guild_id = ? AND {period} = ? AND user_id = ?
+                """, [row[:3] for row in rows])
+                
+                conn.commit()
+                return len(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Error compacting {tier} statistics: {e}")
+            return 0
+    
+    def _incremental_vacuum(self):
+        try:
+            # executescript steps the pragma to completion (execute frees one page)
+            self._connection().executescript("PRAGMA incremental_vacuum")
+        except sqlite3.Error as e:
+            logger.error(f"Error running incremental vacuum: {e}")
+    
+    async def get_join_log_state(self) -> Tuple[List[int], int]:
+        """Get the guilds present in the joins log and its highest join id"""
+        return await self._read(self._get_join_log_state)
+    
+    def _get_join_log_state(self) -> Tuple[List[int], int]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT DISTINCT guild_id FROM joins")
+                guild_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM joins")
+                return guild_ids, cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading join log state: {e}")
+            return [], 0
+    
+    async def replace_guild_aggregates(self, guild_id: int, upto_id: int,
+                                       daily_uses: Dict[Tuple[int, int], int]) -> bool:
+        """Atomically replace a guild's use statistics with ones rebuilt from the joins log
+        
+        daily_uses maps (inviter_id, day number) to uses counted from joins with
+        id <= upto_id. Joins logged after that are added on top, so live writes
+        that happened during the rebuild are kept.
+        """
+        return await self._write_stats(guild_id, self._replace_guild_aggregates, guild_id, upto_id, daily_uses)
+    
+    def _replace_guild_aggregates(self, guild_id: int, upto_id: int,
+                                  daily_uses: Dict[Tuple[int, int], int]) -> bool:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                today = self._roll_windows(cursor)
+                
+                # The rebuilt days replace every tier; compaction rolls them up again
+                for table in ("daily_stats", "weekly_stats", "monthly_stats"):
+                    cursor.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+                cursor.executemany("""
+                    INSERT INTO daily_stats (guild_id, day, user_id, invites_used)
+                    VALUES (?, ?, ?, ?)
+                """, [(guild_id, day, inviter_id, count) for (inviter_id, day), count in daily_uses.items()])
+                
+                totals: Dict[int, int] = {}
+                for (inviter_id, _), count in daily_uses.items():
+                    totals[inviter_id] = totals.get(inviter_id, 0) + count
+                
+                windows = ", ".join(f"uses_{days}d = 0" for days in ROLLING_WINDOWS)
+                cursor.execute(f"UPDATE invite_stats SET total_uses = 0, {windows} WHERE guild_id = ?", (guild_id,))
+                cursor.executemany("""
+                    INSERT INTO invite_stats (guild_id, user_id, total_uses)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (guild_id, user_id) DO UPDATE
+                    SET total_uses = excluded.total_uses, last_updated = CAST(strftime('%s', 'now') AS INTEGER)
+                """, [(guild_id, inviter_id, count) for inviter_id, count in totals.items()])
+                
+                for days in ROLLING_WINDOWS:
+                    cursor.execute(f"""
+                        UPDATE invite_stats SET uses_{days}d = COALESCE((
+                            SELECT SUM(invites_used) FROM daily_stats d
+                            WHERE d.guild_id = invite_stats.guild_id AND d.user_id = invite_stats.user_id
+                            AND d.day >= ?
+                        ), 0)
+                        WHERE guild_id = ?
+                    """, (to_day(today) - days, guild_id))
+                
+                # Joins logged while the rebuild was computing
+                cursor.execute("""
+                    SELECT inviter_id, joined_at FROM joins
+                    WHERE guild_id = ? AND id > ?
+                """, (guild_id, upto_id))
+                uses: Dict[Tuple[int, int, int], int] = {}
+                for inviter_id, joined_at in cursor.fetchall():
+                    key = (guild_id, inviter_id, join_day(joined_at))
+                    uses[key] = uses.get(key, 0) + 1
+                self._apply_invite_uses(cursor, uses)
+                
+                if self._index is not None:
+                    conn.after_commit(self._index.discard, guild_id)
+                conn.commit()
+                logger.info(f"Rebuilt statistics for guild {guild_id} from {sum(totals.values())} logged joins")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error replacing guild statistics: {e}")
+            return False
+    
+    async def get_range_leaderboard(self, guild_id: int, start: datetime, end: datetime,
+                                    limit: int = 10) -> List[Tuple[int, int]]:
+        """Get invite leaderboard for joins in [start, end)"""
+        await self._ensure_fresh()
+        return await self._read(self._get_range_leaderboard, guild_id, int(start.timestamp()), int(end.timestamp()), limit)
+    
+    def _get_range_leaderboard(self, guild_id: int, start: int, end: int, limit: int) -> List[Tuple[int, int]]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT inviter_id, COUNT(*) as range_uses
+                    FROM joins
+                    WHERE guild_id = ? AND joined_at >= ? AND joined_at < ?
+                    GROUP BY inviter_id
+                    ORDER BY range_uses DESC
+                    LIMIT ?
+                """, (guild_id, start, end, limit))
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting range leaderboard: {e}")
             return []
     
     async def get_user_stats(self, guild_id: int, user_id: int) -> Optional[Tuple[int, int]]:
         """Get statistics for a specific user"""
+        await self._ensure_fresh()
+        return await self._read(self._get_user_stats, guild_id, user_id)
+    
+    def _get_user_stats(self, guild_id: int, user_id: int) -> Optional[Tuple[int, int]]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT total_invites, total_uses
@@ -191,21 +1366,210 @@ class InviteDatabase:
             logger.error(f"Error getting user stats: {e}")
             return (0, 0)
     
+    async def update_users(self, guild_id: int,
+                           users: List[Tuple[int, str, Optional[str], Optional[bool]]]):
+        """Remember users' (user_id, name, display_name, left_server) in the guild's directory
+        
+        A display_name or left_server of None keeps the stored value.
+        """
+        await self._write(self._update_users, guild_id, users)
+    
+    def _update_users(self, guild_id: int, users: List[Tuple[int, str, Optional[str], Optional[bool]]]):
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT INTO users (guild_id, user_id, name, display_name, left_server, updated_at)
+                    VALUES (?, ?, ?, ?, COALESCE(?, FALSE), CAST(strftime('%s', 'now') AS INTEGER))
+                    ON CONFLICT (guild_id, user_id) DO UPDATE
+                    SET name = excluded.name,
+                        display_name = COALESCE(?, display_name),
+                        left_server = COALESCE(?, left_server),
+                        updated_at = excluded.updated_at
+                """, [
+                    (guild_id, user_id, name, display_name, left_server, display_name, left_server)
+                    for user_id, name, display_name, left_server in users
+                ])
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error updating user directory: {e}")
+    
+    async def update_invite_counts_bulk(self, guild_id: int, counts: List[Tuple[int, int]]):
+        """Set the total invite count for several users (user_id, invite_count) in one transaction"""
+        await self._write_stats(guild_id, self._update_invite_counts_bulk, guild_id, counts)
+    
+    def _update_invite_counts_bulk(self, guild_id: int, counts: List[Tuple[int, int]]):
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT INTO invite_stats (guild_id, user_id, total_invites)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (guild_id, user_id) DO UPDATE
+                    SET total_invites = excluded.total_invites, last_updated = CAST(strftime('%s', 'now') AS INTEGER)
+                """, [(guild_id, user_id, invite_count) for user_id, invite_count in counts])
+                if self._index is not None:
+                    conn.after_commit(self._index.set_invites, guild_id, counts)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error updating invite counts: {e}")
+    
     async def update_invite_count(self, guild_id: int, user_id: int, invite_count: int):
         """Update the total invite count for a user"""
+        await self._write_stats(guild_id, self._update_invite_count, guild_id, user_id, invite_count)
+    
+    def _update_invite_count(self, guild_id: int, user_id: int, invite_count: int):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                    INSERT OR IGNORE INTO invite_stats (user_id, guild_id, total_invites)
+                    INSERT OR IGNORE INTO invite_stats (guild_id, user_id, total_invites)
                     VALUES (?, ?, 0)
-                """, (user_id, guild_id))
+                """, (guild_id, user_id))
                 
                 cursor.execute("""
                     UPDATE invite_stats 
-                    SET total_invites = ?, last_updated = CURRENT_TIMESTAMP
-                    WHERE user_id = ? AND guild_id = ?
-                """, (invite_count, user_id, guild_id))
+                    SET total_invites = ?, last_updated = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE guild_id = ? AND user_id = ?
+                """, (invite_count, guild_id, user_id))
+                if self._index is not None:
+                    conn.after_commit(self._index.set_invites, guild_id, [(user_id, invite_count)])
                 conn.commit()
         except sqlite3.Error as e:
             logger.error(f"Error updating invite count: {e}")
+
+def shard_path(db_path: str, index: int) -> str:
+    """Path of shard `index`; shard 0 keeps the original database path"""
+    if index == 0:
+        return db_path
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.{index}{ext}"
+
+class ShardedInviteDatabase:
+    """InviteDatabase split across several SQLite files by guild
+    
+    Every guild lives in exactly one shard, chosen from its id, and each shard
+    has its own writer thread and write lock, so guilds on different shards
+    never wait for each other's commits. Per-guild calls go to the guild's
+    shard; calls spanning guilds fan out to every shard and merge the results.
+    Changing the shard count moves guilds to other shards, so existing data
+    has to be re-sharded first.
+    """
+    
+    def __init__(self, db_path: str, shards: int = 2, readers: int = 4, **kwargs):
+        self.db_path = db_path
+        # Readers are split between the shards
+        per_shard_readers = max(1, readers // max(1, shards))
+        self._shards = [
+            InviteDatabase(shard_path(db_path, index), readers=per_shard_readers, **kwargs)
+            for index in range(max(1, shards))
+        ]
+    
+    @property
+    def shards(self) -> List[InviteDatabase]:
+        return self._shards
+    
+    def shard_for(self, guild_id: int) -> InviteDatabase:
+        """The shard holding a guild"""
+        # Hash the snowflake's timestamp: its low bits (worker, process and
+        # increment) are mostly zero for guild ids and would pile up on one shard
+        return self._shards[(guild_id >> 22) % len(self._shards)]
+    
+    async def _fan_out(self, method: str, *args) -> list:
+        """Call a method on every shard concurrently"""
+        return await asyncio.gather(*(getattr(shard, method)(*args) for shard in self._shards))
+    
+    def add_write_listener(self, listener: Callable[[int], None]):
+        """Call listener(guild_id) whenever a guild's invite statistics change"""
+        for shard in self._shards:
+            shard.add_write_listener(listener)
+    
+    def transaction(self):
+        """Group the writes made inside the block (see InviteDatabase.transaction)"""
+        # A unit collects writes for whichever shards they go to
+        return self._shards[0].transaction()
+    
+    async def close(self):
+        await self._fan_out("close")
+    
+    async def flush(self):
+        await self._fan_out("flush")
+    
+    async def add_invite(self, invite_code: str, guild_id: int, inviter_id: int,
+                         max_uses: Optional[int] = None, expires_at: Optional[datetime] = None):
+        await self.shard_for(guild_id).add_invite(invite_code, guild_id, inviter_id, max_uses, expires_at)
+    
+    async def add_invites_bulk(self, guild_id: int,
+                               invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]):
+        await self.shard_for(guild_id).add_invites_bulk(guild_id, invites)
+    
+    async def reconcile_invites(self, guild_id: int,
+                                invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]) -> Dict[int, int]:
+        return await self.shard_for(guild_id).reconcile_invites(guild_id, invites)
+    
+    async def get_active_invites(self, guild_ids: Optional[List[int]] = None) -> List[Tuple[int, str, int, int, Optional[int], Optional[int]]]:
+        if guild_ids is None:
+            results = await self._fan_out("get_active_invites", None)
+        else:
+            by_shard: Dict[InviteDatabase, List[int]] = {}
+            for guild_id in guild_ids:
+                by_shard.setdefault(self.shard_for(guild_id), []).append(guild_id)
+            results = await asyncio.gather(*(
+                shard.get_active_invites(ids) for shard, ids in by_shard.items()
+            ))
+        return [row for rows in results for row in rows]
+    
+    async def update_invite_usage(self, invite_code: str, new_uses: int, guild_id: Optional[int] = None):
+        if guild_id is None:
+            await self._fan_out("update_invite_usage", invite_code, new_uses, None)
+        else:
+            await self.shard_for(guild_id).update_invite_usage(invite_code, new_uses, guild_id)
+    
+    async def remove_invite(self, invite_code: str, guild_id: Optional[int] = None):
+        if guild_id is None:
+            await self._fan_out("remove_invite", invite_code, None)
+        else:
+            await self.shard_for(guild_id).remove_invite(invite_code, guild_id)
+    
+    async def record_invite_use(self, guild_id: int, inviter_id: int, count: int = 1):
+        await self.shard_for(guild_id).record_invite_use(guild_id, inviter_id, count)
+    
+    async def record_joins(self, guild_id: int, joins: List[Tuple[Optional[int], int, Optional[str]]]):
+        await self.shard_for(guild_id).record_joins(guild_id, joins)
+    
+    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Tuple[int, int, int]]:
+        return await self.shard_for(guild_id).get_leaderboard(guild_id, limit)
+    
+    async def get_daily_leaderboard(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple[int, int]]:
+        return await self.shard_for(guild_id).get_daily_leaderboard(guild_id, days, limit)
+    
+    async def get_leaderboard_with_names(self, guild_id: int, limit: int = 10) -> List[Tuple]:
+        return await self.shard_for(guild_id).get_leaderboard_with_names(guild_id, limit)
+    
+    async def get_daily_leaderboard_with_names(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple]:
+        return await self.shard_for(guild_id).get_daily_leaderboard_with_names(guild_id, days, limit)
+    
+    async def update_users(self, guild_id: int,
+                           users: List[Tuple[int, str, Optional[str], Optional[bool]]]):
+        await self.shard_for(guild_id).update_users(guild_id, users)
+    
+    async def get_range_leaderboard(self, guild_id: int, start: datetime, end: datetime,
+                                    limit: int = 10) -> List[Tuple[int, int]]:
+        return await self.shard_for(guild_id).get_range_leaderboard(guild_id, start, end, limit)
+    
+    async def get_user_stats(self, guild_id: int, user_id: int) -> Optional[Tuple[int, int]]:
+        return await self.shard_for(guild_id).get_user_stats(guild_id, user_id)
+    
+    async def update_invite_counts_bulk(self, guild_id: int, counts: List[Tuple[int, int]]):
+        await self.shard_for(guild_id).update_invite_counts_bulk(guild_id, counts)
+    
+    async def update_invite_count(self, guild_id: int, user_id: int, invite_count: int):
+        await self.shard_for(guild_id).update_invite_count(guild_id, user_id, invite_count)
+    
+    async def compact_stats(self, daily_retention_days: int = 90, weekly_retention_days: int = 365,
+                            batch_size: int = 500) -> int:
+        return sum(await self._fan_out("compact_stats", daily_retention_days, weekly_retention_days, batch_size))
+    
+    async def replace_guild_aggregates(self, guild_id: int, upto_id: int,
+                                       daily_uses: Dict[Tuple[int, int], int]) -> bool:
+        return await self.shard_for(guild_id).replace_guild_aggregates(guild_id, upto_id, daily_uses)
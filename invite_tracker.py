@@ -1,16 +1,115 @@
 import discord
 from discord.ext import commands
-from datetime import datetime
-from typing import Dict, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
 import logging
+import time
+
+from storage import InviteStorage, TransactionError
 
 logger = logging.getLogger(__name__)
 
+class CachedInvite:
+    """The parts of a discord.Invite needed to attribute joins"""
+    __slots__ = ("code", "inviter_id", "uses", "max_uses", "expires_at")
+    
+    def __init__(self, code: str, inviter_id: int, uses: int, max_uses: Optional[int],
+                 expires_at: Optional[datetime]):
+        self.code = code
+        self.inviter_id = inviter_id
+        self.uses = uses
+        self.max_uses = max_uses
+        self.expires_at = expires_at
+    
+    @classmethod
+    def from_invite(cls, invite: discord.Invite) -> "CachedInvite":
+        return cls(
+            invite.code,
+            invite.inviter.id if invite.inviter else 0,
+            invite.uses or 0,
+            invite.max_uses,
+            invite.expires_at if invite.expires_at else None
+        )
+    
+    @property
+    def unused_one_time(self) -> bool:
+        """Whether this is a one-time invite whose use would delete it"""
+        return self.max_uses == 1 and self.uses == 0 and bool(self.inviter_id)
+
 class InviteTracker:
-    def __init__(self, bot: commands.Bot, database):
+    def __init__(self, bot: commands.Bot, database: InviteStorage, join_debounce: float = 1.5,
+                 join_retry_delay: float = 10.0):
         self.bot = bot
         self.db = database
-        self.invite_cache: Dict[int, Dict[str, discord.Invite]] = {}
+        self.invite_cache: Dict[int, Dict[str, CachedInvite]] = {}
+        
+        # Active invites per inviter, kept in step with invite_cache so invite
+        # create/delete only touches one inviter's row
+        self.inviter_counts: Dict[int, Dict[int, int]] = {}
+        
+        # Joins arriving within join_debounce seconds of the first one are
+        # attributed together from a single invites fetch
+        self.join_debounce = join_debounce
+        # A burst whose joins could not be stored is attributed again after this many seconds
+        self.join_retry_delay = join_retry_delay
+        self._pending_joins: Dict[int, List[discord.Member]] = {}
+        self._join_tasks: Dict[int, asyncio.Task] = {}
+        
+        # Unused one-time invites deleted shortly before or during a burst, with
+        # when they were deleted. Discord deletes such an invite when it is used,
+        # and the delete event usually arrives before the burst is attributed.
+        self._deleted_invites: Dict[int, Dict[str, Tuple[CachedInvite, float]]] = {}
+        
+        # Every read-modify-write of a guild's invite cache runs under that
+        # guild's lock. asyncio.Lock wakes waiters in FIFO order, so each guild's
+        # events are applied in arrival order while other guilds run in parallel.
+        self._guild_locks: Dict[int, asyncio.Lock] = {}
+    
+    def _guild_lock(self, guild_id: int) -> asyncio.Lock:
+        """Get the lock serializing invite cache updates for a guild"""
+        lock = self._guild_locks.get(guild_id)
+        if lock is None:
+            lock = self._guild_locks[guild_id] = asyncio.Lock()
+        return lock
+    
+    def _prune_deleted_invites(self, guild_id: int):
+        """Forget deleted one-time invites too old to belong to the next burst"""
+        deleted = self._deleted_invites.get(guild_id)
+        if not deleted or guild_id in self._join_tasks:
+            return
+        cutoff = time.monotonic() - self.join_debounce
+        for code, (_, deleted_at) in list(deleted.items()):
+            if deleted_at < cutoff:
+                del deleted[code]
+        if not deleted:
+            del self._deleted_invites[guild_id]
+    
+    @asynccontextmanager
+    async def _guild_transaction(self, guild_id: int):
+        """db.transaction() that puts back the guild's cached invites if its writes are not kept
+        
+        Handlers update the cache inside the block, before the unit commits; a
+        rolled-back unit must leave the cache matching the database so the
+        uses it covered are seen again by the next attribution pass.
+        """
+        invites = self.invite_cache.get(guild_id)
+        counts = self.inviter_counts.get(guild_id)
+        saved = (
+            dict(invites) if invites is not None else None,
+            dict(counts) if counts is not None else None
+        )
+        try:
+            async with self.db.transaction():
+                yield
+        except BaseException:
+            for cache, value in zip((self.invite_cache, self.inviter_counts), saved):
+                if value is None:
+                    cache.pop(guild_id, None)
+                else:
+                    cache[guild_id] = value
+            raise
     
     async def cache_invites(self, guild: discord.Guild):
         """Cache all invites for a guild"""
@@ -19,24 +118,11 @@ class InviteTracker:
                 logger.warning(f"Missing manage_guild permission in {guild.name}")
                 return
             
-            invites = await guild.invites()
-            self.invite_cache[guild.id] = {}
-            
-            for invite in invites:
-                self.invite_cache[guild.id][invite.code] = invite
-                
-                # Store in database
-                expires_at = invite.expires_at if invite.expires_at else None
-                await self.db.add_invite(
-                    invite.code,
-                    guild.id,
-                    invite.inviter.id if invite.inviter else 0,
-                    invite.max_uses,
-                    expires_at
-                )
-                
-                # Update usage count
-                await self.db.update_invite_usage(invite.code, invite.uses)
+            async with self._guild_lock(guild.id):
+                invites = await guild.invites()
+                async with self._guild_transaction(guild.id):
+                    await self._store_invites(guild, [CachedInvite.from_invite(invite) for invite in invites], reconcile=True)
+                    await self._remember_users(guild, [invite.inviter for invite in invites])
             
             logger.info(f"Cached {len(invites)} invites for guild {guild.name}")
             
@@ -45,6 +131,119 @@ class InviteTracker:
         except Exception as e:
             logger.error(f"Error caching invites for guild {guild.name}: {e}")
     
+    async def seed_from_database(self, guilds: List[discord.Guild]):
+        """Seed the invite cache from the stored snapshot so joins can be attributed before warmup"""
+        try:
+            guild_ids = [guild.id for guild in guilds if guild.id not in self.invite_cache]
+            rows = await self.db.get_active_invites(guild_ids)
+            
+            now = datetime.now(timezone.utc)
+            seeded: Dict[int, Dict[str, CachedInvite]] = {guild_id: {} for guild_id in guild_ids}
+            for guild_id, code, inviter_id, uses, max_uses, expires_at in rows:
+                if expires_at is not None:
+                    expires_at = datetime.fromtimestamp(expires_at, timezone.utc)
+                if expires_at and expires_at <= now:
+                    continue
+                seeded[guild_id][code] = CachedInvite(code, inviter_id, uses or 0, max_uses, expires_at)
+            
+            for guild_id, invites in seeded.items():
+                if not invites or guild_id in self.invite_cache:
+                    continue
+                self.invite_cache[guild_id] = invites
+                self.inviter_counts[guild_id] = self._count_invites(guild_id)
+            
+            logger.info(f"Seeded invite cache with {len(rows)} stored invites")
+            
+        except Exception as e:
+            logger.error(f"Error seeding invite cache: {e}")
+    
+    async def warm_up(self, guilds: List[discord.Guild], concurrency: int = 5):
+        """Cache invites for many guilds at once, at most `concurrency` fetches in flight
+        
+        discord.py already waits out per-route rate limit buckets and 429s; the
+        limit keeps a large bot from queueing hundreds of requests behind the
+        global rate limit. Each guild starts attributing joins as soon as its own
+        cache is stored.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        total = len(guilds)
+        done = 0
+        
+        async def warm(guild: discord.Guild):
+            nonlocal done
+            async with semaphore:
+                await self.cache_invites(guild)
+            
+            done += 1
+            if done == total or done % 25 == 0:
+                logger.info(f"Invite cache warmup: {done}/{total} guilds ready")
+        
+        await asyncio.gather(*(warm(guild) for guild in guilds))
+    
+    async def _store_invites(self, guild: discord.Guild, invites: List[CachedInvite], reconcile: bool = False):
+        """Replace the cached invites of a guild and persist the snapshot
+        
+        With reconcile, uses that grew since the stored snapshot (e.g. while the
+        bot was offline) are credited to their inviters.
+        """
+        first_snapshot = guild.id not in self.inviter_counts
+        old_counts = self.inviter_counts.get(guild.id, {})
+        
+        # Store the whole snapshot and the changed counts in a single transaction
+        rows = [
+            (invite.code, invite.inviter_id, invite.uses, invite.max_uses, invite.expires_at)
+            for invite in invites
+        ]
+        async with self._guild_transaction(guild.id):
+            self.invite_cache[guild.id] = {invite.code: invite for invite in invites}
+            self.inviter_counts[guild.id] = self._count_invites(guild.id)
+            
+            if reconcile:
+                await self.db.reconcile_invites(guild.id, rows)
+            else:
+                await self.db.add_invites_bulk(guild.id, rows)
+            
+            # Only persist inviters whose count changed (e.g. invites that expired)
+            new_counts = self.inviter_counts[guild.id]
+            changed = [
+                (user_id, new_counts.get(user_id, 0))
+                for user_id in set(old_counts) | set(new_counts)
+                if first_snapshot or new_counts.get(user_id, 0) != old_counts.get(user_id, 0)
+            ]
+            if changed:
+                await self.db.update_invite_counts_bulk(guild.id, changed)
+    
+    async def _remember_users(self, guild: discord.Guild, users: Iterable[Optional[discord.abc.User]],
+                              left_server: Optional[bool] = None):
+        """Store the names of users seen in events in the guild's user directory
+        
+        A left_server of None keeps whatever the directory already knows.
+        """
+        rows = {
+            user.id: (user.id, user.name, user.display_name, left_server)
+            for user in users if user
+        }
+        if rows:
+            await self.db.update_users(guild.id, list(rows.values()))
+    
+    def _count_invites(self, guild_id: int) -> Dict[int, int]:
+        """Count cached invites per inviter"""
+        invite_counts = {}
+        for invite in self.invite_cache.get(guild_id, {}).values():
+            if invite.inviter_id:
+                invite_counts[invite.inviter_id] = invite_counts.get(invite.inviter_id, 0) + 1
+        return invite_counts
+    
+    async def _adjust_invite_count(self, guild_id: int, inviter_id: int, delta: int):
+        """Apply a +1/-1 change to an inviter's count and persist that row only"""
+        if not inviter_id:
+            return
+        
+        counts = self.inviter_counts.setdefault(guild_id, {})
+        count = max(0, counts.get(inviter_id, 0) + delta)
+        counts[inviter_id] = count
+        await self.db.update_invite_count(guild_id, inviter_id, count)
+    
     async def update_invite_counts(self, guild: discord.Guild):
         """Update invite counts for all members"""
         try:
@@ -52,14 +251,10 @@ class InviteTracker:
                 await self.cache_invites(guild)
                 return
             
-            invite_counts = {}
-            for invite in self.invite_cache[guild.id].values():
-                if invite.inviter:
-                    invite_counts[invite.inviter.id] = invite_counts.get(invite.inviter.id, 0) + 1
-            
-            # Update database with current invite counts
-            for user_id, count in invite_counts.items():
-                await self.db.update_invite_count(guild.id, user_id, count)
+            async with self._guild_lock(guild.id):
+                # Full resync of every inviter's count from the cache
+                self.inviter_counts[guild.id] = self._count_invites(guild.id)
+                await self.db.update_invite_counts_bulk(guild.id, list(self.inviter_counts[guild.id].items()))
                 
         except Exception as e:
             logger.error(f"Error updating invite counts: {e}")
@@ -68,23 +263,28 @@ class InviteTracker:
         """Handle invite creation"""
         try:
             guild = invite.guild
-            if guild.id not in self.invite_cache:
-                self.invite_cache[guild.id] = {}
-            
-            self.invite_cache[guild.id][invite.code] = invite
-            
-            # Store in database
-            expires_at = invite.expires_at if invite.expires_at else None
-            await self.db.add_invite(
-                invite.code,
-                guild.id,
-                invite.inviter.id if invite.inviter else 0,
-                invite.max_uses,
-                expires_at
-            )
-            
-            # Update invite count for the user
-            await self.update_invite_counts(guild)
+            # Store the invite and its inviter's count in one commit
+            async with self._guild_lock(guild.id), self._guild_transaction(guild.id):
+                if guild.id not in self.invite_cache:
+                    self.invite_cache[guild.id] = {}
+                
+                cached = CachedInvite.from_invite(invite)
+                is_new = invite.code not in self.invite_cache[guild.id]
+                self.invite_cache[guild.id][invite.code] = cached
+                
+                await self.db.add_invite(
+                    cached.code,
+                    guild.id,
+                    cached.inviter_id,
+                    cached.max_uses,
+                    cached.expires_at
+                )
+                
+                # Update invite count for the user
+                if is_new:
+                    await self._adjust_invite_count(guild.id, cached.inviter_id, 1)
+                
+                await self._remember_users(guild, [invite.inviter])
             
             logger.debug(f"Invite {invite.code} created by {invite.inviter}")
             
@@ -95,14 +295,22 @@ class InviteTracker:
         """Handle invite deletion"""
         try:
             guild = invite.guild
-            if guild.id in self.invite_cache and invite.code in self.invite_cache[guild.id]:
-                del self.invite_cache[guild.id][invite.code]
-            
-            # Mark as inactive in database
-            await self.db.remove_invite(invite.code)
-            
-            # Update invite count for the user
-            await self.update_invite_counts(guild)
+            async with self._guild_lock(guild.id), self._guild_transaction(guild.id):
+                removed = None
+                if guild.id in self.invite_cache and invite.code in self.invite_cache[guild.id]:
+                    removed = self.invite_cache[guild.id].pop(invite.code)
+                
+                # Mark as inactive in database
+                await self.db.remove_invite(invite.code, guild.id)
+                
+                # Update invite count for the user
+                if removed:
+                    await self._adjust_invite_count(guild.id, removed.inviter_id, -1)
+                
+                # Keep a one-time invite around in case its use is still being attributed
+                if removed and removed.unused_one_time:
+                    self._prune_deleted_invites(guild.id)
+                    self._deleted_invites.setdefault(guild.id, {})[removed.code] = (removed, time.monotonic())
             
             logger.debug(f"Invite {invite.code} deleted")
             
@@ -118,48 +326,108 @@ class InviteTracker:
                 logger.warning(f"Missing manage_guild permission to track invites in {guild.name}")
                 return
             
-            # Get current invites
-            current_invites = await guild.invites()
-            current_invite_dict = {invite.code: invite for invite in current_invites}
-            
-            # Compare with cached invites to find which one was used
-            if guild.id in self.invite_cache:
-                for code, old_invite in self.invite_cache[guild.id].items():
-                    if code in current_invite_dict:
-                        current_invite = current_invite_dict[code]
-                        
-                        # Check if usage increased
-                        if current_invite.uses > old_invite.uses:
-                            # This invite was used
-                            inviter_id = old_invite.inviter.id if old_invite.inviter else 0
-                            
-                            if inviter_id:
-                                await self.db.record_invite_use(guild.id, inviter_id)
-                                logger.info(f"Member {member} joined using invite by {old_invite.inviter}")
-                            
-                            # Update cache
-                            self.invite_cache[guild.id][code] = current_invite
-                            await self.db.update_invite_usage(code, current_invite.uses)
-                            break
-                    else:
-                        # Invite was deleted/expired, might have been a one-time use
-                        if old_invite.max_uses == 1:
-                            inviter_id = old_invite.inviter.id if old_invite.inviter else 0
-                            
-                            if inviter_id:
-                                await self.db.record_invite_use(guild.id, inviter_id)
-                                logger.info(f"Member {member} joined using one-time invite by {old_invite.inviter}")
-                            
-                            # Remove from cache
-                            if code in self.invite_cache[guild.id]:
-                                del self.invite_cache[guild.id][code]
-                            break
-            
-            # Refresh cache with current invites
-            await self.cache_invites(guild)
+            # Queue the join; the first join of a burst schedules the attribution pass
+            self._pending_joins.setdefault(guild.id, []).append(member)
+            if guild.id not in self._join_tasks:
+                self._prune_deleted_invites(guild.id)
+                self._join_tasks[guild.id] = asyncio.create_task(self._process_joins(guild))
             
+        except Exception as e:
+            logger.error(f"Error tracking member join: {e}")
+    
+    async def on_member_remove(self, member: discord.Member):
+        """Mark a departed member in the user directory so leaderboards can name them"""
+        try:
+            await self._remember_users(member.guild, [member], left_server=True)
+        except Exception as e:
+            logger.error(f"Error recording member removal: {e}")
+    
+    async def _process_joins(self, guild: discord.Guild, delay: Optional[float] = None):
+        """Attribute a burst of joins from a single invites fetch"""
+        try:
+            await asyncio.sleep(self.join_debounce if delay is None else delay)
+        finally:
+            # Joins arriving from here on start a new burst
+            del self._join_tasks[guild.id]
+            members = self._pending_joins.pop(guild.id, [])
+        
+        try:
+            async with self._guild_lock(guild.id):
+                if guild.id not in self.invite_cache:
+                    # Nothing to compare against yet; this fetch becomes the baseline
+                    logger.warning(f"Invite cache for {guild.name} not ready, could not attribute {len(members)} joins")
+                    await self._store_invites(guild, [CachedInvite.from_invite(invite) for invite in await guild.invites()])
+                    return
+                
+                # Get current invites
+                current_invites = [CachedInvite.from_invite(invite) for invite in await guild.invites()]
+                current_invite_dict = {invite.code: invite for invite in current_invites}
+                old_invites = self.invite_cache[guild.id]
+                
+                # Compare with cached invites to find how many times each invite was used
+                uses: List[CachedInvite] = []
+                for code, current_invite in current_invite_dict.items():
+                    old_invite = old_invites.get(code)
+                    if old_invite is None:
+                        # Never cached (its create event was missed), so its
+                        # earlier uses are unknown; this snapshot becomes its baseline
+                        continue
+                    delta = current_invite.uses - old_invite.uses
+                    if delta > 0 and current_invite.inviter_id:
+                        uses.extend([current_invite] * delta)
+                
+                for code, old_invite in old_invites.items():
+                    # Invite was deleted/expired, might have been a one-time use
+                    if code not in current_invite_dict and old_invite.unused_one_time:
+                        uses.append(old_invite)
+                
+                # One-time invites whose delete event arrived before this pass
+                deleted = list(self._deleted_invites.get(guild.id, {}))
+                for code in deleted:
+                    if code not in current_invite_dict:
+                        uses.append(self._deleted_invites[guild.id][code][0])
+                
+                # The joins and the refreshed snapshot commit together, so a
+                # crash can never count a use without storing its invite's uses
+                async with self._guild_transaction(guild.id):
+                    await self._remember_users(guild, members, left_server=False)
+                    
+                    # Pair uses with the joined members in arrival order. Within a burst
+                    # that spans several invites the pairing is a best guess; uses
+                    # without a matching member are logged without one.
+                    await self.db.record_joins(guild.id, [
+                        (members[i].id if i < len(members) else None, invite.inviter_id, invite.code)
+                        for i, invite in enumerate(uses)
+                    ])
+                    
+                    inviters = {invite.inviter_id for invite in uses}
+                    if len(members) == 1 and len(uses) == 1:
+                        logger.info(f"Member {members[0]} joined using invite by {uses[0].inviter_id}")
+                    else:
+                        logger.info(
+                            f"Attributed {len(uses)} invite uses to {len(inviters)} "
+                            f"inviters for {len(members)} joins in {guild.name}"
+                        )
+                    
+                    # Refresh cache with the invites we just fetched
+                    await self._store_invites(guild, current_invites)
+                
+                # Only forget the deleted invites once their uses are stored
+                remaining = self._deleted_invites.get(guild.id)
+                if remaining is not None:
+                    for code in deleted:
+                        remaining.pop(code, None)
+                    if not remaining:
+                        del self._deleted_invites[guild.id]
+                
         except discord.Forbidden:
             logger.error(f"No permission to track invites in guild {guild.name}")
+        except TransactionError as e:
+            # The cache was put back, so the next pass sees these uses again
+            logger.error(f"Could not store {len(members)} joins in {guild.name}, retrying: {e}")
+            self._pending_joins[guild.id] = members + self._pending_joins.get(guild.id, [])
+            if guild.id not in self._join_tasks:
+                self._join_tasks[guild.id] = asyncio.create_task(self._process_joins(guild, self.join_retry_delay))
         except Exception as e:
             logger.error(f"Error tracking member join: {e}")
     
@@ -1,80 +1,82 @@
 import discord
 from discord.ext import commands
-from datetime import datetime
+import asyncio
+from datetime import date, datetime
 import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from name_resolver import UserNameResolver
+from storage import InviteStorage
 
 logger = logging.getLogger(__name__)
 
 class LeaderboardManager:
-    def __init__(self, bot: commands.Bot, database):
+    def __init__(self, bot: commands.Bot, database: InviteStorage,
+                 names: Optional[UserNameResolver] = None, cache_ttl: float = 300.0):
         self.bot = bot
         self.db = database
+        self.names = names or UserNameResolver(bot)
+        
+        # (guild_id, leaderboard_type) -> (expires at, date built, embed dict).
+        # Entries are dropped when the database reports a write to the guild;
+        # the TTL bounds how stale names and the date window can get.
+        self.cache_ttl = cache_ttl
+        self._embed_cache: Dict[Tuple[int, str], Tuple[float, date, dict]] = {}
+        # Bumped per guild on every invalidation, so a build that raced a write is not cached
+        self._generations: Dict[int, int] = {}
+        # Builds in flight per (guild_id, leaderboard_type), awaited by later requests
+        self._builds: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_coalesced = 0
+        database.add_write_listener(self.invalidate)
+    
+    def invalidate(self, guild_id: int):
+        """Drop the cached leaderboards of a guild"""
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        for leaderboard_type in ("all", "daily"):
+            self._embed_cache.pop((guild_id, leaderboard_type), None)
+            # Requests from now on must not join a build that predates the write
+            self._builds.pop((guild_id, leaderboard_type), None)
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """Embed and user name cache counters for monitoring"""
+        return {
+            "embed_hits": self.cache_hits,
+            "embed_misses": self.cache_misses,
+            "embed_coalesced": self.cache_coalesced,
+            "embeds_cached": len(self._embed_cache),
+            "name_hits": self.names.hits,
+            "name_misses": self.names.misses,
+        }
     
     async def create_leaderboard_embed(self, guild: discord.Guild, leaderboard_type: str = "all") -> discord.Embed:
-        """Create a leaderboard embed"""
+        """Create a leaderboard embed, reusing the cached one while the guild's statistics are unchanged"""
         try:
-            if leaderboard_type == "daily":
-                data = await self.db.get_daily_leaderboard(guild.id, days=7, limit=10)
-                title = "📊 Weekly Invite Leaderboard"
-                description = "Top inviters from the past 7 days"
-                value_label = "Recent Invites"
-            else:
-                data = await self.db.get_leaderboard(guild.id, limit=10)
-                title = "🏆 All-Time Invite Leaderboard"
-                description = "Top inviters of all time"
-                value_label = "Total Invites Used"
-            
-            embed = discord.Embed(
-                title=title,
-                description=description,
-                color=0x5865F2,
-                timestamp=datetime.now()
-            )
-            
-            if not data:
-                embed.add_field(
-                    name="No Data Available",
-                    value="No invite statistics found for this server.",
-                    inline=False
-                )
-                return embed
-            
-            leaderboard_text = ""
-            medals = ["🥇", "🥈", "🥉"]
+            leaderboard_type = "daily" if leaderboard_type == "daily" else "all"
+            key = (guild.id, leaderboard_type)
+            today = datetime.now().date()
             
-            for i, entry in enumerate(data):
-                if leaderboard_type == "daily":
-                    user_id, invite_count = entry
-                else:
-                    user_id, total_invites, invite_count = entry
-                
-                # Get user object
-                user = guild.get_member(user_id)
-                if not user:
-                    try:
-                        user = await self.bot.fetch_user(user_id)
-                        username = f"{user.name} (Left Server)"
-                    except:
-                        username = f"Unknown User ({user_id})"
+            cached = self._embed_cache.get(key)
+            if cached and cached[0] > time.monotonic() and cached[1] == today:
+                self.cache_hits += 1
+                payload = cached[2]
+            else:
+                # Concurrent requests for the same leaderboard share one build
+                build = self._builds.get(key)
+                if build is None:
+                    self.cache_misses += 1
+                    build = asyncio.create_task(self._build_and_cache(guild, leaderboard_type, today))
+                    self._builds[key] = build
+                    build.add_done_callback(lambda task: self._build_done(key, task))
                 else:
-                    username = user.display_name
-                
-                # Add medal for top 3
-                medal = medals[i] if i < 3 else f"{i + 1}."
-                
-                leaderboard_text += f"{medal} **{username}** - {invite_count} {value_label.lower()}\n"
-            
-            embed.add_field(
-                name=value_label,
-                value=leaderboard_text or "No data available",
-                inline=False
-            )
-            
-            embed.set_footer(
-                text=f"Requested by {guild.name}",
-                icon_url=guild.icon.url if guild.icon else None
-            )
+                    self.cache_coalesced += 1
+                payload = await asyncio.shield(build)
             
+            # A fresh Embed per use, since callers may edit it
+            embed = discord.Embed.from_dict(payload)
+            embed.timestamp = datetime.now()
             return embed
             
         except Exception as e:
@@ -87,6 +89,115 @@ class LeaderboardManager:
             )
             return error_embed
     
+    async def _build_and_cache(self, guild: discord.Guild, leaderboard_type: str, today: date) -> dict:
+        generation = self._generations.get(guild.id, 0)
+        payload = (await self._build_leaderboard_embed(guild, leaderboard_type)).to_dict()
+        
+        # Skip storing if the guild changed while the embed was being built
+        if self._generations.get(guild.id, 0) == generation:
+            self._embed_cache[(guild.id, leaderboard_type)] = (time.monotonic() + self.cache_ttl, today, payload)
+        return payload
+    
+    def _build_done(self, key: Tuple[int, str], task: asyncio.Task):
+        # invalidate() may already have replaced this build with a newer one
+        if self._builds.get(key) is task:
+            del self._builds[key]
+    
+    async def _build_leaderboard_embed(self, guild: discord.Guild, leaderboard_type: str) -> discord.Embed:
+        if leaderboard_type == "daily":
+            data = await self.db.get_daily_leaderboard_with_names(guild.id, days=7, limit=10)
+            title = "📊 Weekly Invite Leaderboard"
+            description = "Top inviters from the past 7 days"
+            value_label = "Recent Invites"
+        else:
+            data = await self.db.get_leaderboard_with_names(guild.id, limit=10)
+            title = "🏆 All-Time Invite Leaderboard"
+            description = "Top inviters of all time"
+            value_label = "Total Invites Used"
+        
+        embed = discord.Embed(
+            title=title,
+            description=description,
+            color=0x5865F2,
+            timestamp=datetime.now()
+        )
+        
+        if not data:
+            embed.add_field(
+                name="No Data Available",
+                value="No invite statistics found for this server.",
+                inline=False
+            )
+            return embed
+        
+        leaderboard_text = ""
+        medals = ["🥇", "🥈", "🥉"]
+        
+        # Each row ends with the user's stored (name, display_name, left_server)
+        usernames = await self._usernames(guild, [(entry[0], *entry[-3:]) for entry in data])
+        
+        for i, entry in enumerate(data):
+            if leaderboard_type == "daily":
+                user_id, invite_count = entry[:2]
+            else:
+                user_id, total_invites, invite_count = entry[:3]
+            
+            username = usernames[user_id]
+            
+            # Add medal for top 3
+            medal = medals[i] if i < 3 else f"{i + 1}."
+            
+            leaderboard_text += f"{medal} **{username}** - {invite_count} {value_label.lower()}\n"
+        
+        embed.add_field(
+            name=value_label,
+            value=leaderboard_text or "No data available",
+            inline=False
+        )
+        
+        embed.set_footer(
+            text=f"Requested by {guild.name}",
+            icon_url=guild.icon.url if guild.icon else None
+        )
+        
+        return embed
+    
+    async def _usernames(self, guild: discord.Guild,
+                         users: List[Tuple[int, Optional[str], Optional[str], Optional[bool]]]) -> Dict[int, str]:
+        """Names for ranked users from the member cache, else the stored user directory
+        
+        Only users the directory has never seen are looked up over the network
+        (concurrently); what the lookups and the member cache show is written
+        back so the next leaderboard needs no requests.
+        """
+        names: Dict[int, str] = {}
+        updates = []
+        unknown = []
+        for user_id, name, display_name, left_server in users:
+            member = guild.get_member(user_id)
+            if member:
+                names[user_id] = member.display_name
+                if (name, display_name, bool(left_server)) != (member.name, member.display_name, False):
+                    updates.append((user_id, member.name, member.display_name, False))
+            elif left_server is not None:
+                # In the directory, by name or as a user Discord does not know
+                names[user_id] = self.names.departed_name(user_id, name)
+                if not left_server:
+                    updates.append((user_id, name, None, True))
+            else:
+                unknown.append(user_id)
+        
+        if unknown:
+            found = await self.names.lookup(unknown)
+            for user_id in unknown:
+                names[user_id] = self.names.departed_name(user_id, found.get(user_id))
+                if user_id in found:
+                    updates.append((user_id, found[user_id], None, True))
+        
+        if updates:
+            await self.db.update_users(guild.id, updates)
+        return names
+    
     async def create_user_stats_embed(self, guild: discord.Guild, user: discord.Member) -> discord.Embed:
         """Create an embed showing individual user statistics"""
         try:
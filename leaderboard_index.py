@@ -0,0 +1,134 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class GuildLeaderboard:
+    """One guild's (user_id, total_invites, total_uses) rows in leaderboard order
+    
+    Rows are kept in a list sorted by (-total_uses, -total_invites, user_id),
+    the order get_leaderboard returns, so the top N is the first N entries.
+    A row is found by binary search; moving it is a list delete and insert,
+    which shifts the entries after it with one memmove.
+    
+    data_version is the database's PRAGMA data_version when the rows were
+    read, and checked_at when it was last confirmed unchanged.
+    """
+    
+    __slots__ = ("_rows", "_order", "data_version", "checked_at")
+    
+    def __init__(self, rows: Iterable[Tuple[int, int, int]], data_version: int = 0):
+        self.data_version = data_version
+        self.checked_at = time.monotonic()
+        # user_id -> (total_invites, total_uses)
+        self._rows: Dict[int, Tuple[int, int]] = {
+            user_id: (total_invites, total_uses) for user_id, total_invites, total_uses in rows
+        }
+        self._order = sorted(self._key(user_id, *row) for user_id, row in self._rows.items())
+    
+    @staticmethod
+    def _key(user_id: int, total_invites: int, total_uses: int) -> Tuple[int, int, int]:
+        return (-total_uses, -total_invites, user_id)
+    
+    def update(self, user_id: int, total_invites: int, total_uses: int):
+        """Set a user's row, moving it to its new rank"""
+        old = self._rows.get(user_id)
+        if old is not None:
+            del self._order[bisect_left(self._order, self._key(user_id, *old))]
+        self._rows[user_id] = (total_invites, total_uses)
+        insort(self._order, self._key(user_id, total_invites, total_uses))
+    
+    def add_uses(self, user_id: int, count: int):
+        total_invites, total_uses = self._rows.get(user_id, (0, 0))
+        self.update(user_id, total_invites, total_uses + count)
+    
+    def set_invites(self, user_id: int, total_invites: int):
+        _, total_uses = self._rows.get(user_id, (0, 0))
+        self.update(user_id, total_invites, total_uses)
+    
+    def top(self, limit: int) -> List[Tuple[int, int, int]]:
+        """The first `limit` rows as (user_id, total_invites, total_uses)"""
+        return [
+            (user_id, -total_invites, -total_uses)
+            for total_uses, total_invites, user_id in self._order[:limit]
+        ]
+    
+    def __len__(self) -> int:
+        return len(self._order)
+
+class LeaderboardIndex:
+    """In-memory leaderboards of the `max_guilds` most recently read guilds
+    
+    The database loads a guild on its first leaderboard read and then applies
+    each committed change to its statistics here. Changes to guilds that are
+    not loaded are ignored; they are read from the database when next needed.
+    Changes arrive on the database's writer thread while reads come from the
+    event loop, so every method holds a lock.
+    
+    Writes by other processes (the rebuild CLI, another bot, manual SQL) are
+    not applied here. Each guild remembers the data_version it was read at,
+    and the database re-checks it before trusting rows older than its check
+    interval, reloading the guild when the file was changed by someone else.
+    """
+    
+    def __init__(self, max_guilds: int = 1000):
+        self.max_guilds = max_guilds
+        self._guilds: "OrderedDict[int, GuildLeaderboard]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.loads = 0
+    
+    def top(self, guild_id: int, limit: int, max_age: Optional[float] = None) -> Optional[List[Tuple[int, int, int]]]:
+        """A guild's top rows, or None if the guild is not loaded or was last
+        checked against the database more than max_age seconds ago"""
+        with self._lock:
+            leaderboard = self._guilds.get(guild_id)
+            if leaderboard is None:
+                return None
+            if max_age is not None and time.monotonic() - leaderboard.checked_at > max_age:
+                return None
+            self._guilds.move_to_end(guild_id)
+            self.hits += 1
+            return leaderboard.top(limit)
+    
+    def confirm(self, guild_id: int, data_version: int) -> bool:
+        """Mark a loaded guild as checked if it was read at data_version"""
+        with self._lock:
+            leaderboard = self._guilds.get(guild_id)
+            if leaderboard is None or leaderboard.data_version != data_version:
+                return False
+            leaderboard.checked_at = time.monotonic()
+            return True
+    
+    def load(self, guild_id: int, rows: Iterable[Tuple[int, int, int]], data_version: int = 0):
+        """Install a guild's full set of (user_id, total_invites, total_uses) rows"""
+        leaderboard = GuildLeaderboard(rows, data_version)
+        with self._lock:
+            self._guilds[guild_id] = leaderboard
+            self._guilds.move_to_end(guild_id)
+            self.loads += 1
+            while len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+    
+    def add_uses(self, uses: Dict[Tuple[int, int], int]):
+        """Add (guild_id, user_id) -> count to total_uses"""
+        with self._lock:
+            for (guild_id, user_id), count in uses.items():
+                leaderboard = self._guilds.get(guild_id)
+                if leaderboard is not None:
+                    leaderboard.add_uses(user_id, count)
+    
+    def set_invites(self, guild_id: int, counts: List[Tuple[int, int]]):
+        """Set total_invites for (user_id, invite_count) pairs"""
+        with self._lock:
+            leaderboard = self._guilds.get(guild_id)
+            if leaderboard is not None:
+                for user_id, invite_count in counts:
+                    leaderboard.set_invites(user_id, invite_count)
+    
+    def discard(self, guild_id: int):
+        """Forget a guild so its next read loads it again"""
+        with self._lock:
+            self._guilds.pop(guild_id, None)
@@ -0,0 +1,348 @@
+import asyncio
+import heapq
+import logging
+import os
+import pickle
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import ROLLING_WINDOWS, from_day, join_day, to_day, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the layout of a snapshot changes
+SNAPSHOT_VERSION = 1
+
+class MemoryStorage:
+    """Invite storage kept entirely in memory
+    
+    Implements InviteStorage with plain dicts: invites and per-user totals per
+    guild, per-day use counts and an append-only join list for range queries.
+    Leaderboards pick their top rows with heapq. With a snapshot_path the state
+    is loaded at startup and written back snapshot_interval seconds after a
+    change and on close; without one everything is lost on restart.
+    """
+    
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 60.0):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        
+        # guild_id -> code -> [inviter_id, uses, max_uses, expires_at, is_active]
+        self.invites: Dict[int, Dict[str, list]] = {}
+        # guild_id -> user_id -> [total_invites, total_uses]
+        self.stats: Dict[int, Dict[int, List[int]]] = {}
+        # guild_id -> day number -> user_id -> uses; compacted weeks and months
+        # are kept under their first day, like the SQLite rollup tiers
+        self.daily: Dict[int, Dict[int, Dict[int, int]]] = {}
+        # guild_id -> [(joined_at, member_id, inviter_id, invite_code)] in join order
+        self.joins: Dict[int, List[Tuple[int, Optional[int], int, Optional[str]]]] = {}
+        # guild_id -> user_id -> [name, display_name, left_server, updated_at]
+        self.users: Dict[int, Dict[int, list]] = {}
+        
+        # Called with a guild id after that guild's statistics changed
+        self._write_listeners: List[Callable[[int], None]] = []
+        
+        self._snapshot_handle: Optional[asyncio.TimerHandle] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._snapshot_lock = asyncio.Lock()
+        
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load_snapshot()
+    
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") != SNAPSHOT_VERSION:
+                logger.warning(f"Ignoring snapshot {self.snapshot_path} with version {state.get('version')}")
+                return
+            self.invites = state["invites"]
+            self.stats = state["stats"]
+            self.daily = state["daily"]
+            self.joins = state["joins"]
+            self.users = state.get("users", {})
+            logger.info(f"Loaded in-memory storage snapshot for {len(self.stats)} guilds")
+        except (OSError, pickle.UnpicklingError, KeyError) as e:
+            logger.error(f"Error loading storage snapshot: {e}")
+    
+    def add_write_listener(self, listener: Callable[[int], None]):
+        """Call listener(guild_id) whenever a guild's invite statistics change"""
+        self._write_listeners.append(listener)
+    
+    def _stats_changed(self, guild_id: int):
+        for listener in self._write_listeners:
+            try:
+                listener(guild_id)
+            except Exception as e:
+                logger.error(f"Error in storage write listener: {e}")
+    
+    def _changed(self):
+        """Schedule a snapshot once the snapshot interval has passed"""
+        if self.snapshot_path and self._snapshot_handle is None:
+            loop = asyncio.get_running_loop()
+            self._snapshot_handle = loop.call_later(self.snapshot_interval, self._schedule_snapshot)
+    
+    def _schedule_snapshot(self):
+        self._snapshot_handle = None
+        self._snapshot_task = asyncio.get_running_loop().create_task(self.snapshot())
+    
+    async def snapshot(self):
+        """Write the current state to snapshot_path"""
+        if self._snapshot_handle is not None:
+            self._snapshot_handle.cancel()
+            self._snapshot_handle = None
+        if not self.snapshot_path:
+            return
+        
+        async with self._snapshot_lock:
+            # Pickled on the event loop so the snapshot is consistent; only the
+            # file write happens off it
+            data = pickle.dumps({
+                "version": SNAPSHOT_VERSION,
+                "invites": self.invites,
+                "stats": self.stats,
+                "daily": self.daily,
+                "joins": self.joins,
+                "users": self.users,
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write_snapshot, data)
+    
+    def _write_snapshot(self, data: bytes):
+        try:
+            # Replace the old snapshot only once the new one is fully on disk
+            temp_path = f"{self.snapshot_path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            logger.debug(f"Wrote {len(data)} byte storage snapshot")
+        except OSError as e:
+            logger.error(f"Error writing storage snapshot: {e}")
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Group writes; in memory every write already applies at once"""
+        yield self
+    
+    async def close(self):
+        """Write a final snapshot"""
+        await self.snapshot()
+    
+    async def flush(self):
+        """Nothing is buffered in memory"""
+    
+    def _stats_row(self, guild_id: int, user_id: int) -> List[int]:
+        return self.stats.setdefault(guild_id, {}).setdefault(user_id, [0, 0])
+    
+    async def add_invite(self, invite_code: str, guild_id: int, inviter_id: int,
+                         max_uses: Optional[int] = None, expires_at: Optional[datetime] = None):
+        """Add a new invite"""
+        self.invites.setdefault(guild_id, {})[invite_code] = [inviter_id, 0, max_uses, to_epoch(expires_at), True]
+        self._changed()
+    
+    async def add_invites_bulk(self, guild_id: int,
+                               invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]):
+        """Store a guild's invite snapshot (code, inviter_id, uses, max_uses, expires_at)"""
+        self._upsert_invites(guild_id, invites)
+        self._changed()
+    
+    def _upsert_invites(self, guild_id: int,
+                        invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]):
+        stored = self.invites.setdefault(guild_id, {})
+        for code, inviter_id, uses, max_uses, expires_at in invites:
+            stored[code] = [inviter_id, uses, max_uses, to_epoch(expires_at), True]
+    
+    async def reconcile_invites(self, guild_id: int,
+                                invites: List[Tuple[str, int, int, Optional[int], Optional[datetime]]]) -> Dict[int, int]:
+        """Store a freshly fetched invite snapshot, crediting uses missed since the stored one"""
+        stored = self.invites.get(guild_id, {})
+        stored_uses = {code: invite[1] for code, invite in stored.items() if invite[4]}
+        
+        missed: Dict[int, int] = {}
+        missed_joins = []
+        for code, inviter_id, uses, _, _ in invites:
+            delta = uses - (stored_uses.get(code) or 0)
+            if code in stored_uses and delta > 0 and inviter_id:
+                missed[inviter_id] = missed.get(inviter_id, 0) + delta
+                missed_joins.extend([(None, inviter_id, code)] * delta)
+        
+        if missed_joins:
+            self._record_joins(guild_id, missed_joins)
+            self._stats_changed(guild_id)
+        
+        self._upsert_invites(guild_id, invites)
+        
+        fetched = {invite[0] for invite in invites}
+        for code in stored_uses:
+            if code not in fetched:
+                stored[code][4] = False
+        
+        self._changed()
+        if missed:
+            logger.info(f"Credited {sum(missed.values())} missed invite uses to {len(missed)} inviters in guild {guild_id}")
+        return missed
+    
+    async def get_active_invites(self, guild_ids: Optional[List[int]] = None) -> List[Tuple[int, str, int, int, Optional[int], Optional[int]]]:
+        """Get stored active invites (guild_id, code, inviter_id, uses, max_uses, expires_at), optionally for some guilds"""
+        if guild_ids is None:
+            guild_ids = list(self.invites)
+        return [
+            (guild_id, code, inviter_id, uses, max_uses, expires_at)
+            for guild_id in guild_ids
+            for code, (inviter_id, uses, max_uses, expires_at, is_active) in self.invites.get(guild_id, {}).items()
+            if is_active
+        ]
+    
+    def _find_invites(self, invite_code: str, guild_id: Optional[int]) -> List[list]:
+        guild_ids = list(self.invites) if guild_id is None else [guild_id]
+        return [
+            self.invites[gid][invite_code]
+            for gid in guild_ids
+            if invite_code in self.invites.get(gid, {})
+        ]
+    
+    async def update_invite_usage(self, invite_code: str, new_uses: int, guild_id: Optional[int] = None):
+        """Update invite usage count"""
+        for invite in self._find_invites(invite_code, guild_id):
+            invite[1] = new_uses
+        self._changed()
+    
+    async def remove_invite(self, invite_code: str, guild_id: Optional[int] = None):
+        """Mark an invite as inactive"""
+        for invite in self._find_invites(invite_code, guild_id):
+            invite[4] = False
+        self._changed()
+    
+    async def record_invite_use(self, guild_id: int, inviter_id: int, count: int = 1):
+        """Record that an invite was used"""
+        await self.record_joins(guild_id, [(None, inviter_id, None)] * count)
+    
+    async def record_joins(self, guild_id: int, joins: List[Tuple[Optional[int], int, Optional[str]]]):
+        """Record attributed joins (member_id, inviter_id, invite_code)"""
+        self._record_joins(guild_id, joins)
+        self._changed()
+        if joins:
+            self._stats_changed(guild_id)
+    
+    def _record_joins(self, guild_id: int, joins: List[Tuple[Optional[int], int, Optional[str]]]):
+        joined_at = int(time.time())
+        day = self.daily.setdefault(guild_id, {}).setdefault(join_day(joined_at), {})
+        log = self.joins.setdefault(guild_id, [])
+        for member_id, inviter_id, invite_code in joins:
+            log.append((joined_at, member_id, inviter_id, invite_code))
+            self._stats_row(guild_id, inviter_id)[1] += 1
+            day[inviter_id] = day.get(inviter_id, 0) + 1
+    
+    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Tuple[int, int, int]]:
+        """Get invite leaderboard for a guild"""
+        top = heapq.nlargest(
+            limit, self.stats.get(guild_id, {}).items(),
+            key=lambda item: (item[1][1], item[1][0])
+        )
+        return [(user_id, total_invites, total_uses) for user_id, (total_invites, total_uses) in top]
+    
+    async def get_leaderboard_with_names(self, guild_id: int, limit: int = 10) -> List[Tuple]:
+        """Get invite leaderboard rows with the user's stored (name, display_name, left_server) appended"""
+        return self._with_names(guild_id, await self.get_leaderboard(guild_id, limit))
+    
+    async def get_daily_leaderboard_with_names(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple]:
+        """Get daily leaderboard rows with the user's stored (name, display_name, left_server) appended"""
+        return self._with_names(guild_id, await self.get_daily_leaderboard(guild_id, days, limit))
+    
+    def _with_names(self, guild_id: int, rows: List[Tuple]) -> List[Tuple]:
+        users = self.users.get(guild_id, {})
+        return [(*row, *users.get(row[0], (None, None, None))[:3]) for row in rows]
+    
+    async def get_daily_leaderboard(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple[int, int]]:
+        """Get daily invite leaderboard for specified number of days"""
+        cutoff = to_day(datetime.now().date()) - days
+        recent: Dict[int, int] = {}
+        for day, uses in self.daily.get(guild_id, {}).items():
+            if day >= cutoff:
+                for user_id, count in uses.items():
+                    recent[user_id] = recent.get(user_id, 0) + count
+        return heapq.nlargest(limit, recent.items(), key=lambda item: item[1])
+    
+    async def get_range_leaderboard(self, guild_id: int, start: datetime, end: datetime,
+                                    limit: int = 10) -> List[Tuple[int, int]]:
+        """Get invite leaderboard for joins in [start, end)"""
+        log = self.joins.get(guild_id, [])
+        first = bisect_left(log, int(start.timestamp()), key=lambda join: join[0])
+        last = bisect_left(log, int(end.timestamp()), lo=first, key=lambda join: join[0])
+        
+        counts: Dict[int, int] = {}
+        for _, _, inviter_id, _ in log[first:last]:
+            counts[inviter_id] = counts.get(inviter_id, 0) + 1
+        return heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+    
+    async def get_user_stats(self, guild_id: int, user_id: int) -> Optional[Tuple[int, int]]:
+        """Get statistics for a specific user"""
+        row = self.stats.get(guild_id, {}).get(user_id)
+        return tuple(row) if row else (0, 0)
+    
+    async def update_users(self, guild_id: int,
+                           users: List[Tuple[int, str, Optional[str], Optional[bool]]]):
+        """Remember users' (user_id, name, display_name, left_server); None keeps the stored value"""
+        directory = self.users.setdefault(guild_id, {})
+        now = int(time.time())
+        for user_id, name, display_name, left_server in users:
+            entry = directory.setdefault(user_id, [None, None, False, now])
+            entry[0] = name
+            if display_name is not None:
+                entry[1] = display_name
+            if left_server is not None:
+                entry[2] = left_server
+            entry[3] = now
+        self._changed()
+    
+    async def update_invite_counts_bulk(self, guild_id: int, counts: List[Tuple[int, int]]):
+        """Set the total invite count for several users (user_id, invite_count)"""
+        for user_id, invite_count in counts:
+            self._stats_row(guild_id, user_id)[0] = invite_count
+        self._changed()
+        self._stats_changed(guild_id)
+    
+    async def update_invite_count(self, guild_id: int, user_id: int, invite_count: int):
+        """Update the total invite count for a user"""
+        self._stats_row(guild_id, user_id)[0] = invite_count
+        self._changed()
+        self._stats_changed(guild_id)
+    
+    async def compact_stats(self, daily_retention_days: int = 90, weekly_retention_days: int = 365,
+                            batch_size: int = 500) -> int:
+        """Fold old days into their week, and old weeks into their month
+        
+        batch_size is accepted for compatibility; in memory there is no lock to
+        hold. Returns the day entries folded.
+        """
+        daily_retention_days = max(daily_retention_days, max(ROLLING_WINDOWS) + 1)
+        weekly_retention_days = max(weekly_retention_days, daily_retention_days)
+        today = to_day(datetime.now().date())
+        
+        compacted = 0
+        for guild_days in self.daily.values():
+            for day in sorted(guild_days):
+                start = from_day(day)
+                if day < today - weekly_retention_days:
+                    period = to_day(start.replace(day=1))
+                elif day < today - daily_retention_days:
+                    period = to_day(start - timedelta(days=start.weekday()))
+                else:
+                    break
+                if period == day:
+                    continue
+        
+                target = guild_days.setdefault(period, {})
+                for user_id, count in guild_days.pop(day).items():
+                    target[user_id] = target.get(user_id, 0) + count
+                compacted += 1
+        
+        if compacted:
+            self._changed()
+            logger.info(f"Compacted {compacted} statistics rows into rollup periods")
+        return compacted
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+logger = logging.getLogger(__name__)
+
+# Returned by a fetch that failed for a reason other than the user not existing
+_FAILED = object()
+
+class UserNameResolver:
+    """Resolve user ids to names for users who are not in the member cache
+    
+    Users are looked up with fetch_user, at most `concurrency` requests at a
+    time, and remembered in an LRU cache for `ttl` seconds. Users Discord does
+    not know are cached too, for `negative_ttl` seconds, so they are not
+    fetched on every command.
+    """
+    
+    def __init__(self, bot: commands.Bot, cache_size: int = 1000, ttl: float = 3600.0,
+                 negative_ttl: float = 300.0, concurrency: int = 5):
+        self.bot = bot
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        # user_id -> (expires at, user name or None if the user does not exist)
+        self._cache: "OrderedDict[int, Tuple[float, Optional[str]]]" = OrderedDict()
+        # Lookups in flight, shared by callers asking for the same user
+        self._fetches: Dict[int, asyncio.Task] = {}
+        
+        self.hits = 0
+        self.misses = 0
+    
+    async def lookup(self, user_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """User names, fetching unknown ones concurrently
+        
+        Users that do not exist map to None; users whose fetch failed are left out.
+        """
+        names: Dict[int, Optional[str]] = {}
+        missing = []
+        for user_id in user_ids:
+            found, name = self._cached(user_id)
+            if not found:
+                # Users the client already has cached cost no request
+                user = self.bot.get_user(user_id)
+                if user:
+                    found, name = True, self._store(user_id, user.name)
+            
+            if found:
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+        
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            names.update((user_id, name) for user_id, name in zip(missing, fetched) if name is not _FAILED)
+        
+        return names
+    
+    @staticmethod
+    def departed_name(user_id: int, name: Optional[str]) -> str:
+        """How a user who is not in the guild is shown"""
+        if name is None:
+            return f"Unknown User ({user_id})"
+        return f"{name} (Left Server)"
+    
+    def _cached(self, user_id: int) -> Tuple[bool, Optional[str]]:
+        """(found, name) from the cache, dropping the entry if it has expired"""
+        entry = self._cache.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        
+        expires_at, name = entry
+        if expires_at <= time.monotonic():
+            del self._cache[user_id]
+            self.misses += 1
+            return False, None
+        
+        self._cache.move_to_end(user_id)
+        self.hits += 1
+        return True, name
+    
+    def _store(self, user_id: int, name: Optional[str]) -> Optional[str]:
+        ttl = self.ttl if name is not None else self.negative_ttl
+        self._cache[user_id] = (time.monotonic() + ttl, name)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return name
+    
+    async def _fetch(self, user_id: int):
+        task = self._fetches.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch_user(user_id))
+            self._fetches[user_id] = task
+            task.add_done_callback(lambda _: self._fetches.pop(user_id, None))
+        return await asyncio.shield(task)
+    
+    async def _fetch_user(self, user_id: int):
+        async with self._semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+                return self._store(user_id, user.name)
+            except discord.NotFound:
+                return self._store(user_id, None)
+            except discord.HTTPException as e:
+                # Not cached: the next lookup should try again
+                logger.warning(f"Could not fetch user {user_id}: {e}")
+                return _FAILED
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import sqlite3
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from database import InviteDatabase, ShardedInviteDatabase, join_day
+
+logger = logging.getLogger(__name__)
+
+def count_guild_joins(db_path: str, guild_id: int, upto_id: int,
+                      chunk_size: int = 50000) -> Dict[Tuple[int, int], int]:
+    """Count a guild's logged joins per (inviter_id, day number), up to join id upto_id
+    
+    Runs in a worker thread or process with its own read-only connection, streaming the
+    log in chunks so large guilds do not have to fit in memory at once.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT inviter_id, joined_at FROM joins
+            WHERE guild_id = ? AND id <= ?
+        """, (guild_id, upto_id))
+        
+        daily_uses: Dict[Tuple[int, int], int] = {}
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for inviter_id, joined_at in rows:
+                key = (inviter_id, join_day(joined_at))
+                daily_uses[key] = daily_uses.get(key, 0) + 1
+        return daily_uses
+    finally:
+        conn.close()
+
+async def rebuild_aggregates(db: InviteDatabase, guild_ids: Optional[List[int]] = None,
+                             pool: Optional[Executor] = None) -> List[int]:
+    """Recompute invite_stats/daily_stats uses from the joins log
+    
+    Guilds are counted on `pool` (the CLI passes a process pool) or, by
+    default, on worker threads. Each guild's result is then swapped in with
+    one short transaction on the writer thread, so live writes keep flowing
+    while the rebuild runs. Returns the rebuilt guilds.
+    """
+    # Make sure every buffered join is in the log first
+    await db.flush()
+    
+    # Join ids are per database file, so each shard is counted against its own log
+    work = []
+    for shard in db.shards:
+        logged_guilds, upto_id = await shard.get_join_log_state()
+        if guild_ids is None:
+            shard_guilds = logged_guilds
+        else:
+            shard_guilds = [guild_id for guild_id in guild_ids if db.shard_for(guild_id) is shard]
+        work.extend((shard, guild_id, upto_id) for guild_id in shard_guilds)
+    
+    loop = asyncio.get_running_loop()
+    counts = [
+        loop.run_in_executor(pool, count_guild_joins, shard.db_path, guild_id, upto_id)
+        for shard, guild_id, upto_id in work
+    ]
+    
+    rebuilt = []
+    for (shard, guild_id, upto_id), daily_uses in zip(work, counts):
+        if await shard.replace_guild_aggregates(guild_id, upto_id, await daily_uses):
+            rebuilt.append(guild_id)
+    return rebuilt
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild invite statistics from the joins log")
+    parser.add_argument("--db", default=None, help="database path (defaults to DATABASE_PATH)")
+    parser.add_argument("--guild", type=int, action="append", dest="guilds",
+                        help="guild id to rebuild (repeatable, defaults to all guilds)")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes")
+    parser.add_argument("--shards", type=int, default=None, help="database shards (defaults to DATABASE_SHARDS)")
+    args = parser.parse_args()
+    
+    if args.db is None:
+        from config import DATABASE_PATH
+        args.db = DATABASE_PATH
+    if args.shards is None:
+        from config import DATABASE_SHARDS
+        args.shards = DATABASE_SHARDS
+    
+    db = ShardedInviteDatabase(args.db, shards=args.shards) if args.shards > 1 else InviteDatabase(args.db)
+    try:
+        # Only the offline CLI uses processes: spawned workers re-import their
+        # parent's main module, which for the bot would start another bot.
+        # spawn keeps them clear of the database threads.
+        with ProcessPoolExecutor(max_workers=args.processes,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            rebuilt = await rebuild_aggregates(db, args.guilds, pool)
+        logger.info(f"Rebuilt statistics for {len(rebuilt)} guilds")
+    finally:
+        await db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
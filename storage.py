@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import AsyncContextManager, Callable, Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+# (code, inviter_id, uses, max_uses, expires_at) as passed in invite snapshots
+InviteRow = Tuple[str, int, int, Optional[int], Optional[datetime]]
+
+# (guild_id, code, inviter_id, uses, max_uses, expires_at epoch seconds) as stored
+StoredInvite = Tuple[int, str, int, int, Optional[int], Optional[int]]
+
+class TransactionError(Exception):
+    """The writes of a transaction() block were rolled back"""
+
+@runtime_checkable
+class InviteStorage(Protocol):
+    """What the tracker, leaderboards and bot need from a storage backend
+    
+    Implemented by InviteDatabase and ShardedInviteDatabase (SQLite) and by
+    MemoryStorage. Maintenance that only makes sense for SQLite, such as
+    rebuilding from the joins log, stays on the SQLite classes.
+    """
+    
+    def add_write_listener(self, listener: Callable[[int], None]):
+        """Call listener(guild_id) whenever a guild's invite statistics change"""
+        ...
+    
+    def transaction(self) -> AsyncContextManager:
+        """Group the writes made inside the block into a single commit
+        
+        Raises TransactionError on leaving the block if the writes were not kept.
+        """
+        ...
+    
+    async def close(self):
+        """Persist anything pending and release resources"""
+        ...
+    
+    async def flush(self):
+        """Write buffered joins"""
+        ...
+    
+    async def add_invite(self, invite_code: str, guild_id: int, inviter_id: int,
+                         max_uses: Optional[int] = None, expires_at: Optional[datetime] = None):
+        ...
+    
+    async def add_invites_bulk(self, guild_id: int, invites: List[InviteRow]):
+        ...
+    
+    async def reconcile_invites(self, guild_id: int, invites: List[InviteRow]) -> Dict[int, int]:
+        ...
+    
+    async def get_active_invites(self, guild_ids: Optional[List[int]] = None) -> List[StoredInvite]:
+        ...
+    
+    async def update_invite_usage(self, invite_code: str, new_uses: int, guild_id: Optional[int] = None):
+        ...
+    
+    async def remove_invite(self, invite_code: str, guild_id: Optional[int] = None):
+        ...
+    
+    async def record_invite_use(self, guild_id: int, inviter_id: int, count: int = 1):
+        ...
+    
+    async def record_joins(self, guild_id: int, joins: List[Tuple[Optional[int], int, Optional[str]]]):
+        ...
+    
+    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Tuple[int, int, int]]:
+        ...
+    
+    async def get_daily_leaderboard(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple[int, int]]:
+        ...
+    
+    async def get_leaderboard_with_names(self, guild_id: int, limit: int = 10) -> List[Tuple]:
+        """Leaderboard rows with the user's stored (name, display_name, left_server) appended
+        
+        Storage errors are raised rather than read as an empty leaderboard.
+        """
+        ...
+    
+    async def get_daily_leaderboard_with_names(self, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple]:
+        ...
+    
+    async def get_range_leaderboard(self, guild_id: int, start: datetime, end: datetime,
+                                    limit: int = 10) -> List[Tuple[int, int]]:
+        ...
+    
+    async def get_user_stats(self, guild_id: int, user_id: int) -> Optional[Tuple[int, int]]:
+        ...
+    
+    async def update_users(self, guild_id: int, users: List[Tuple[int, str, Optional[str], Optional[bool]]]):
+        """Remember users' (user_id, name, display_name, left_server) in the guild's directory"""
+        ...
+    
+    async def update_invite_counts_bulk(self, guild_id: int, counts: List[Tuple[int, int]]):
+        ...
+    
+    async def update_invite_count(self, guild_id: int, user_id: int, invite_count: int):
+        ...
+    
+    async def compact_stats(self, daily_retention_days: int = 90, weekly_retention_days: int = 365,
+                            batch_size: int = 500) -> int:
+        ...
@@ -0,0 +1,195 @@
+import asyncio
+import random
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+
+from database import InviteDatabase, to_day
+from rebuild import rebuild_aggregates
+from storage import TransactionError
+
+GUILD = 1
+
+def run(scenario, path, **options):
+    """Run scenario(db) against a database at path, closing it afterwards"""
+    async def main():
+        db = InviteDatabase(str(path), **options)
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+    return asyncio.run(main())
+
+@contextmanager
+def locked(path):
+    """Hold the database's write lock from another connection"""
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    finally:
+        conn.execute("ROLLBACK")
+        conn.close()
+
+def query(path, sql, *args):
+    conn = sqlite3.connect(str(path))
+    try:
+        return conn.execute(sql, args).fetchall()
+    finally:
+        conn.close()
+
+def test_failed_unit_raises_and_keeps_none_of_its_writes(tmp_path):
+    path = tmp_path / "invites.db"
+    changed = []
+    
+    async def scenario(db):
+        db.add_write_listener(changed.append)
+        await db.update_invite_count(GUILD, 10, 1)
+        changed.clear()
+        
+        with locked(path):
+            with pytest.raises(TransactionError):
+                async with db.transaction():
+                    await db.update_invite_count(GUILD, 10, 5)
+                    await db.record_joins(GUILD, [(100, 10, "a")])
+        return await db.get_leaderboard(GUILD)
+    
+    assert run(scenario, path, busy_timeout=0.05) == [(10, 1, 0)]
+    assert query(path, "SELECT COUNT(*) FROM joins") == [(0,)]
+    assert changed == []
+
+def test_buffered_joins_are_flushed_before_reads(tmp_path):
+    path = tmp_path / "invites.db"
+    
+    async def scenario(db):
+        await db.record_joins(GUILD, [(100, 10, "a"), (101, 10, "a")])
+        buffered = query(path, "SELECT COUNT(*) FROM joins")
+        return buffered, await db.get_leaderboard(GUILD)
+    
+    buffered, leaderboard = run(scenario, path, flush_size=100, flush_interval=60)
+    assert buffered == [(0,)]
+    assert leaderboard == [(10, 0, 2)]
+
+def test_failed_flush_keeps_joins_for_the_next_one(tmp_path):
+    path = tmp_path / "invites.db"
+    
+    async def scenario(db):
+        await db.record_joins(GUILD, [(100, 10, "a")])
+        with locked(path):
+            await db.flush()
+        pending = len(db._pending_joins)
+        await db.flush()
+        return pending, await db.get_leaderboard(GUILD)
+    
+    pending, leaderboard = run(scenario, path, busy_timeout=0.05, flush_size=100, flush_interval=60)
+    assert pending == 1
+    assert leaderboard == [(10, 0, 1)]
+
+def test_rolling_windows_drop_days_that_aged_out(tmp_path):
+    path = tmp_path / "invites.db"
+    today = to_day(date.today())
+    run(lambda db: db.flush(), path)
+    
+    # Five uses eight days ago, counted while the windows were last rolled two days ago
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.execute("INSERT INTO daily_stats (guild_id, day, user_id, invites_used) VALUES (?, ?, 10, 5)", (GUILD, today - 8))
+        conn.execute("""
+            INSERT INTO invite_stats (guild_id, user_id, total_uses, uses_1d, uses_7d, uses_30d)
+            VALUES (?, 10, 5, 0, 5, 5)
+        """, (GUILD,))
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'window_date'", (today - 2,))
+    conn.close()
+    
+    async def scenario(db):
+        return await db.get_daily_leaderboard(GUILD, days=7), await db.get_daily_leaderboard(GUILD, days=30)
+    
+    assert run(scenario, path) == ([], [(10, 5)])
+    assert query(path, "SELECT value FROM meta WHERE key = 'window_date'") == [(today,)]
+
+def test_compaction_rolls_old_days_into_weeks(tmp_path):
+    path = tmp_path / "invites.db"
+    old = date.today() - timedelta(days=200)
+    monday = old - timedelta(days=old.weekday())
+    run(lambda db: db.flush(), path)
+    
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.executemany("INSERT INTO daily_stats (guild_id, day, user_id, invites_used) VALUES (?, ?, 10, ?)", [
+            (GUILD, to_day(monday), 2),
+            (GUILD, to_day(monday) + 1, 3),
+            (GUILD, to_day(date.today()), 4),
+        ])
+    conn.close()
+    
+    async def scenario(db):
+        compacted = await db.compact_stats(daily_retention_days=90, weekly_retention_days=365, batch_size=1)
+        return compacted, await db.get_daily_leaderboard(GUILD, days=365)
+    
+    assert run(scenario, path) == (2, [(10, 9)])
+    assert query(path, "SELECT day, invites_used FROM daily_stats") == [(to_day(date.today()), 4)]
+    assert query(path, "SELECT week, invites_used FROM weekly_stats") == [(to_day(monday), 5)]
+
+def test_rebuild_restores_uses_from_the_join_log(tmp_path):
+    path = tmp_path / "invites.db"
+    
+    async def scenario(db):
+        async with db.transaction():
+            await db.record_joins(GUILD, [(100, 10, "a"), (101, 10, "a"), (102, 11, "b")])
+        await db.get_leaderboard(GUILD)
+        
+        # Another process corrupts the aggregates the index was loaded from
+        conn = sqlite3.connect(str(path))
+        with conn:
+            conn.execute("UPDATE invite_stats SET total_uses = 99 WHERE user_id = 10")
+        conn.close()
+        
+        rebuilt = await rebuild_aggregates(db)
+        return rebuilt, await db.get_leaderboard(GUILD)
+    
+    rebuilt, leaderboard = run(scenario, path)
+    assert rebuilt == [GUILD]
+    assert leaderboard == [(10, 0, 2), (11, 0, 1)]
+
+def test_leaderboard_index_matches_sql(tmp_path):
+    path = tmp_path / "invites.db"
+    rng = random.Random(0)
+    
+    async def scenario(db):
+        await db.get_leaderboard(GUILD)
+        await asyncio.sleep(0.05)
+        for _ in range(200):
+            user = rng.randint(1, 30)
+            if rng.random() < 0.3:
+                await db.update_invite_count(GUILD, user, rng.randint(0, 5))
+            else:
+                async with db.transaction():
+                    await db.record_joins(GUILD, [(None, user, None)] * rng.randint(1, 3))
+        indexed = db._index.top(GUILD, 50)
+        return indexed, db._get_leaderboard(GUILD, 50)
+    
+    indexed, stored = run(scenario, path, index_check_interval=60)
+    assert indexed == stored
+    assert len(stored) == 30
+
+def test_leaderboard_index_reloads_after_external_writes(tmp_path):
+    path = tmp_path / "invites.db"
+    
+    async def scenario(db):
+        await db.update_invite_count(GUILD, 10, 1)
+        await db.get_leaderboard(GUILD)
+        await asyncio.sleep(0.05)
+        
+        conn = sqlite3.connect(str(path))
+        with conn:
+            conn.execute("UPDATE invite_stats SET total_uses = 7 WHERE user_id = 10")
+        conn.close()
+        
+        # The stale read falls back to SQL while the index reloads behind it
+        first = await db.get_leaderboard(GUILD)
+        await asyncio.sleep(0.05)
+        return first, db._index.top(GUILD, 10)
+    
+    assert run(scenario, path, index_check_interval=0) == ([(10, 1, 7)], [(10, 1, 7)])
@@ -0,0 +1,113 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+pytest.importorskip("discord")
+
+from benchmarks.fakes import FakeGuild, FakeInvite, FakeMember
+from database import InviteDatabase
+from invite_tracker import InviteTracker
+
+DEBOUNCE = 0.05
+
+def run_tracker(tmp_path, scenario, **options):
+    """Run scenario(tracker, guild, db) against a fresh database"""
+    async def main():
+        db = InviteDatabase(str(tmp_path / "invites.db"), **options)
+        tracker = InviteTracker(None, db, join_debounce=DEBOUNCE, join_retry_delay=DEBOUNCE)
+        guild = FakeGuild(1, fetch_delay=0)
+        try:
+            return await scenario(tracker, guild, db)
+        finally:
+            await db.close()
+    return asyncio.run(main())
+
+async def settle():
+    await asyncio.sleep(DEBOUNCE * 4)
+
+def test_join_credits_the_used_invite(tmp_path):
+    async def scenario(tracker, guild, db):
+        guild.invites_state = {"a": (10, 0), "b": (11, 0)}
+        await tracker.cache_invites(guild)
+        
+        guild.invites_state = {"a": (10, 2), "b": (11, 0)}
+        await tracker.on_member_join(FakeMember(guild, 100))
+        await tracker.on_member_join(FakeMember(guild, 101))
+        await settle()
+        return await db.get_leaderboard(guild.id)
+    
+    assert run_tracker(tmp_path, scenario) == [(10, 1, 2), (11, 1, 0)]
+
+def test_one_time_invite_deleted_before_the_burst_is_credited(tmp_path):
+    async def scenario(tracker, guild, db):
+        guild.invites_state = {"once": (10, 0, 1)}
+        await tracker.cache_invites(guild)
+        
+        # Discord deletes the used invite; the delete event beats the debounced pass
+        guild.invites_state = {}
+        await tracker.on_member_join(FakeMember(guild, 100))
+        await tracker.on_invite_delete(FakeInvite(guild, "once", 10, 1, 1))
+        await settle()
+        return await db.get_leaderboard(guild.id), tracker._deleted_invites
+    
+    leaderboard, deleted = run_tracker(tmp_path, scenario)
+    assert leaderboard == [(10, 0, 1)]
+    assert deleted == {}
+
+def test_one_time_invite_deleted_without_a_join_is_not_credited(tmp_path):
+    async def scenario(tracker, guild, db):
+        guild.invites_state = {"once": (10, 0, 1), "a": (11, 0)}
+        await tracker.cache_invites(guild)
+        
+        guild.invites_state = {"a": (11, 0)}
+        await tracker.on_invite_delete(FakeInvite(guild, "once", 10, 0, 1))
+        await settle()
+        
+        guild.invites_state = {"a": (11, 1)}
+        await tracker.on_member_join(FakeMember(guild, 100))
+        await settle()
+        return await db.get_leaderboard(guild.id)
+    
+    assert run_tracker(tmp_path, scenario) == [(11, 1, 1), (10, 0, 0)]
+
+def test_uncached_invite_is_not_credited(tmp_path):
+    async def scenario(tracker, guild, db):
+        guild.invites_state = {"a": (10, 0)}
+        await tracker.cache_invites(guild)
+        
+        # "old" was created while its create event was missed and has a history of uses
+        guild.invites_state = {"a": (10, 1), "old": (11, 40)}
+        await tracker.on_member_join(FakeMember(guild, 100))
+        await settle()
+        
+        guild.invites_state = {"a": (10, 1), "old": (11, 41)}
+        await tracker.on_member_join(FakeMember(guild, 101))
+        await settle()
+        return await db.get_leaderboard(guild.id)
+    
+    assert run_tracker(tmp_path, scenario) == [(10, 1, 1), (11, 1, 1)]
+
+def test_failed_burst_restores_the_cache_and_is_retried(tmp_path):
+    async def scenario(tracker, guild, db):
+        guild.invites_state = {"a": (10, 0)}
+        await tracker.cache_invites(guild)
+        
+        lock = sqlite3.connect(db.db_path, isolation_level=None)
+        lock.execute("BEGIN IMMEDIATE")
+        guild.invites_state = {"a": (10, 1)}
+        await tracker.on_member_join(FakeMember(guild, 100))
+        await tracker._join_tasks[guild.id]
+        
+        # The rolled-back burst left the cache as it was and queued its joins again
+        cached_uses = tracker.invite_cache[guild.id]["a"].uses
+        retrying = guild.id in tracker._join_tasks and len(tracker._pending_joins[guild.id]) == 1
+        lock.execute("ROLLBACK")
+        lock.close()
+        await settle()
+        return cached_uses, retrying, await db.get_leaderboard(guild.id)
+    
+    cached_uses, retrying, leaderboard = run_tracker(tmp_path, scenario, busy_timeout=0.05)
+    assert cached_uses == 0
+    assert retrying
+    assert leaderboard == [(10, 1, 1)]
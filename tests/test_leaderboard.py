@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("discord")
+
+from benchmarks.fakes import FakeBot, FakeGuild
+from database import InviteDatabase
+from leaderboard import LeaderboardManager
+
+def run_manager(tmp_path, scenario):
+    """Run scenario(manager, guild, db) with a guild whose inviters 10..14 have uses"""
+    async def main():
+        db = InviteDatabase(str(tmp_path / "invites.db"))
+        guild = FakeGuild(1, fetch_delay=0)
+        async with db.transaction():
+            for user_id in range(10, 15):
+                await db.record_joins(guild.id, [(None, user_id, None)] * (user_id - 9))
+        try:
+            return await scenario(LeaderboardManager(FakeBot(fetch_delay=0.01), db), guild, db)
+        finally:
+            await db.close()
+    return asyncio.run(main())
+
+def test_embed_is_cached_until_the_guild_changes(tmp_path):
+    async def scenario(manager, guild, db):
+        first = await manager.create_leaderboard_embed(guild)
+        await manager.create_leaderboard_embed(guild)
+        hits = manager.cache_hits
+        
+        await db.update_invite_count(guild.id, 10, 3)
+        async with db.transaction():
+            await db.record_joins(guild.id, [(None, 10, None)] * 10)
+        changed = await manager.create_leaderboard_embed(guild)
+        return first, hits, changed, manager.cache_stats()
+    
+    first, hits, changed, stats = run_manager(tmp_path, scenario)
+    assert hits == 1
+    assert first.fields[0].value.startswith("🥇 **user14 (Left Server)** - 5 ")
+    assert changed.fields[0].value.startswith("🥇 **user10 (Left Server)** - 11 ")
+    assert stats["embed_misses"] == 2
+
+def test_concurrent_requests_share_one_build(tmp_path):
+    async def scenario(manager, guild, db):
+        reads = 0
+        read = db.get_leaderboard_with_names
+        
+        async def counted_read(*args, **kwargs):
+            nonlocal reads
+            reads += 1
+            return await read(*args, **kwargs)
+        
+        db.get_leaderboard_with_names = counted_read
+        embeds = await asyncio.gather(*(manager.create_leaderboard_embed(guild) for _ in range(20)))
+        return reads, {embed.fields[0].value for embed in embeds}, manager.cache_stats(), manager.bot.fetches
+    
+    reads, values, stats, fetches = run_manager(tmp_path, scenario)
+    assert reads == 1
+    assert len(values) == 1
+    assert (stats["embed_misses"], stats["embed_coalesced"]) == (1, 19)
+    assert fetches == 5
@@ -0,0 +1,75 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import database
+from database import MIGRATIONS, InviteDatabase
+
+@pytest.fixture
+def db(tmp_path):
+    db = InviteDatabase(str(tmp_path / "invites.db"), index_guilds=0)
+    yield db
+    asyncio.run(db.close())
+
+def query_plan(db, read, *args):
+    """EXPLAIN QUERY PLAN details of the SELECT a read method runs"""
+    conn = db._connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        read(*args)
+    finally:
+        conn.set_trace_callback(None)
+    query = next(statement for statement in statements if "SELECT" in statement)
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+
+def assert_indexed(plan, index):
+    assert any(f"USING COVERING INDEX {index}" in step for step in plan), plan
+    assert not any(step.startswith("SCAN invite_stats") for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+def test_migrations_set_user_version(db):
+    conn = sqlite3.connect(db.db_path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    finally:
+        conn.close()
+
+def test_migrations_upgrade_initial_schema(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    database._migrate_initial_schema(conn.cursor())
+    conn.execute("INSERT INTO invite_stats (user_id, guild_id, total_invites, total_uses) VALUES (2, 1, 3, 4)")
+    conn.commit()
+    conn.close()
+    
+    db = InviteDatabase(path, index_guilds=0)
+    try:
+        conn = sqlite3.connect(path)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        conn.close()
+        assert db._get_user_stats(1, 2) == (3, 4)
+    finally:
+        asyncio.run(db.close())
+
+def test_all_time_leaderboard_uses_covering_index(db):
+    plan = query_plan(db, db._get_leaderboard, 1, 10)
+    assert_indexed(plan, "idx_invite_stats_leaderboard")
+
+def test_weekly_leaderboard_uses_covering_index(db):
+    # Only the 7-day window, which the bot's weekly leaderboard reads, has an index
+    plan = query_plan(db, db._get_window_leaderboard, 1, 7, 10)
+    assert_indexed(plan, "idx_invite_stats_weekly")
+
+def test_named_leaderboard_looks_up_users_by_key(db):
+    plan = query_plan(db, db._get_leaderboard, 1, 10, True)
+    assert any("USING COVERING INDEX idx_invite_stats_leaderboard" in step for step in plan), plan
+    assert any(step.startswith("SEARCH u USING PRIMARY KEY") for step in plan), plan
+    assert not any(step.startswith("SCAN u") for step in plan), plan
+
+def test_daily_leaderboard_searches_by_guild(db):
+    plan = query_plan(db, db._get_daily_leaderboard, 1, 14, 10)
+    for table in ("daily_stats", "weekly_stats", "monthly_stats"):
+        assert any(step.startswith(f"SEARCH {table} USING PRIMARY KEY (guild_id=?") for step in plan), plan
+        assert not any(step.startswith(f"SCAN {table}") for step in plan), plan